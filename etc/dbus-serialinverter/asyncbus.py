@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import concurrent.futures
+import sys
+import os
+from threading import Lock, Thread
+
+from utils import logger
+
+sys.path.insert(
+    1,
+    os.path.join(
+        os.path.dirname(__file__),
+        "/opt/victronenergy/dbus-serialinverter/pymodbus",
+    ),
+)
+
+from pymodbus.client import AsyncModbusSerialClient
+from pymodbus.exceptions import ModbusException, ModbusIOException
+
+# Extra time granted to a request on top of the Modbus timeout before it is given up
+REQUEST_MARGIN = 0.5
+
+_io_loop = None
+_io_loop_lock = Lock()
+
+
+def get_io_loop() -> asyncio.AbstractEventLoop:
+    """
+    :return: the asyncio loop doing the serial IO of all ports, started on first use
+    """
+    global _io_loop
+    with _io_loop_lock:
+        if _io_loop is None:
+            _io_loop = asyncio.new_event_loop()
+            Thread(target=_io_loop.run_forever, name="modbus-io", daemon=True).start()
+        return _io_loop
+
+
+class AsyncClientAdapter:
+    """
+    Blocking facade with the interface of ModbusSerialClient used by the drivers, backed by an
+    AsyncModbusSerialClient on the shared IO loop. All ports of the process are served by that one
+    loop and the bundled serial_asyncio transport, the poller threads only wait for the results.
+    """
+
+    def __init__(self, port, baudrate, timeout):
+        self.loop = get_io_loop()
+        self.socket = None
+        self.client = self._run(self._create(port, baudrate, timeout), timeout)
+        self.params = self.client.params
+        logger.info("Creating AsyncModbusSerialClient on port %s with baudrate %s" % (port, baudrate))
+
+    @staticmethod
+    async def _create(port, baudrate, timeout):
+        # Created inside the loop, the client binds its asyncio primitives to it
+        return AsyncModbusSerialClient(port = port, baudrate = baudrate, stopbits = 1, parity = 'N', bytesize = 8, timeout = timeout)
+
+    def _run(self, coro, timeout):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout + REQUEST_MARGIN)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def connect(self) -> bool:
+        if self.client.connected:
+            return True
+        try:
+            return self._run(asyncio.wait_for(self.client.connect(), self.params.timeout), self.params.timeout)
+        except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
+            logger.error("Timeout connecting to %s" % self.params.port)
+            return False
+
+    def close(self) -> None:
+        if self.client.connected:
+            self._run(self.client.close(), self.params.timeout)
+
+    def read_input_registers(self, address, count, slave):
+        return self._request(self.client.read_input_registers, address = address, count = count, slave = slave)
+
+    def write_registers(self, address, values, slave):
+        return self._request(self.client.write_registers, address, values, slave = slave)
+
+    def _request(self, method, *args, **kwargs):
+        async def request():
+            # The protocol copies the timeout on connect, keep it in sync with set_timeout() of the driver
+            if self.client.protocol is not None:
+                self.client.protocol.params.timeout = self.params.timeout
+            return await method(*args, **kwargs)
+
+        try:
+            return self._run(request(), self.params.timeout)
+        except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
+            return ModbusIOException("No response received within %s s" % self.params.timeout)
+        except ModbusException as e:
+            return ModbusIOException(str(e))
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark of the poll loop.
+
+Drives Solis.refresh_data() and DbusHelper.publish_dbus() against simulator.py, the dbus service
+is a stub, so nothing is published. The dbus and gi modules still have to be importable, like on
+VenusOS. The results are written as JSON to compare releases, e.g.:
+
+    ./benchmark.py --polls 200 --output benchmark-0.1.1.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from statistics import mean
+from time import perf_counter, sleep, thread_time
+
+from dbushelper import DbusHelper
+from solis import Solis
+from utils import logger
+import utils
+
+BAUDRATES = (9600, 19200, 115200)
+
+
+class StubDbusService:
+    """
+    Stands in for VeDbusService, keeps the values and counts the writes.
+    """
+
+    def __init__(self):
+        self.values = {"/UpdateIndex": 0}
+        self.writes = 0
+
+    def add_path(self, path, value, **kwargs):
+        self.values[path] = value
+
+    def __getitem__(self, path):
+        return self.values[path]
+
+    def __setitem__(self, path, value):
+        self.values[path] = value
+        self.writes += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class CountingSerial:
+    """
+    Wraps the serial port of a client and counts the bytes written and read into a WireCounter.
+    """
+
+    def __init__(self, serial, counter):
+        self._serial = serial
+        self._counter = counter
+
+    def write(self, data):
+        self._counter.written += len(data)
+        return self._serial.write(data)
+
+    def read(self, size=1):
+        data = self._serial.read(size)
+        self._counter.received += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._serial, name)
+
+
+class WireCounter:
+    """
+    Counts the bytes a client writes to and reads from its serial port. A reconnect opens a new
+    port, so the port is wrapped again after every connect().
+    """
+
+    def __init__(self, client):
+        self.written = 0
+        self.received = 0
+        self._client = client
+        self._connect = client.connect
+        client.connect = self.connect
+        self.wrap()
+
+    def connect(self):
+        connected = self._connect()
+        self.wrap()
+        return connected
+
+    def wrap(self):
+        socket = self._client.socket
+        if socket is not None and not isinstance(socket, CountingSerial):
+            self._client.socket = CountingSerial(socket, self)
+
+
+def start_simulator(link, baudrate, args):
+    simulator = subprocess.Popen(
+        [
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "simulator.py"),
+            "--link", link, "--baudrate", str(baudrate),
+            "--delay", str(args.delay), "--jitter", str(args.jitter),
+            "--drop", str(args.drop), "--corrupt", str(args.corrupt), "--noise", str(args.noise),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        if os.path.exists(link):
+            return simulator
+        sleep(0.05)
+    simulator.kill()
+    raise RuntimeError("Simulator did not start")
+
+
+def percentiles(values, fractions=(0.5, 0.9, 0.95, 0.99)):
+    ordered = sorted(values)
+    result = {"p%d" % (fraction * 100): ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] for fraction in fractions}
+    result["max"] = ordered[-1]
+    result["mean"] = mean(ordered)
+    return {key: round(value, 3) for key, value in result.items()}
+
+
+def poll(helper):
+    snapshot = helper.refresh_inverter()
+    if snapshot is not None:
+        helper.publish_dbus(snapshot)
+    return snapshot is not None
+
+
+def run(baudrate, args):
+    """
+    Benchmark the poll loop at one baudrate.
+
+    :return: the results
+    """
+    link = os.path.join(tempfile.mkdtemp(), "ttySIM")
+    simulator = start_simulator(link, baudrate, args)
+    try:
+        inverter = Solis(link, baudrate, 1)
+        if not any(inverter.test_connection() for _ in range(3)):
+            raise RuntimeError("No connection to the simulator at %s baud" % baudrate)
+
+        dbusservice = StubDbusService()
+        helper = DbusHelper(inverter, dbusservice)
+        wire = WireCounter(inverter.client)
+
+        # Warm up, the first polls read all tiers and compile the register maps
+        for _ in range(args.warmup):
+            poll(helper)
+        wire.written = wire.received = dbusservice.writes = 0
+
+        latencies = []
+        cpu = []
+        failed = 0
+        started = perf_counter()
+        for _ in range(args.polls):
+            wall, thread = perf_counter(), thread_time()
+            if not poll(helper):
+                raise RuntimeError("Too many failed polls at %s baud" % baudrate)
+            cpu.append((thread_time() - thread) * 1000)
+            latencies.append((perf_counter() - wall) * 1000)
+            failed += helper.error_count > 0
+        elapsed = perf_counter() - started
+
+        # Allocations in a separate pass, tracing slows down the polls
+        peak = []
+        retained = []
+        for _ in range(args.alloc_polls):
+            tracemalloc.start()
+            poll(helper)
+            current, maximum = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            retained.append(current)
+            peak.append(maximum)
+
+        inverter.close()
+        return {
+            "baudrate": baudrate,
+            "polls": args.polls,
+            "failed_polls": failed,
+            "polls_per_second": round(args.polls / elapsed, 2),
+            "latency_ms": percentiles(latencies),
+            "cpu_ms_per_poll": percentiles(cpu),
+            "allocated_bytes_peak_per_poll": round(mean(peak)) if peak else None,
+            "retained_bytes_per_poll": round(mean(retained)) if retained else None,
+            "bytes_written_per_poll": round(wire.written / args.polls, 1),
+            "bytes_read_per_poll": round(wire.received / args.polls, 1),
+            "dbus_writes_per_poll": round(dbusservice.writes / args.polls, 2),
+            "timeouts": inverter.client.timeout_count,
+            "crc_errors": inverter.client.crc_error_count,
+            "resyncs": inverter.client.resync_count,
+        }
+    finally:
+        simulator.kill()
+        simulator.wait()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the poll loop against simulator.py")
+    parser.add_argument("--baudrates", default=",".join(str(baudrate) for baudrate in BAUDRATES))
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--alloc-polls", type=int, default=20, help="polls traced for allocations")
+    parser.add_argument("--delay", type=float, default=0.0, help="simulator response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="simulator response delay variation in seconds")
+    parser.add_argument("--drop", type=float, default=0.0, help="probability of the simulator dropping a response")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="probability of the simulator corrupting a CRC")
+    parser.add_argument("--noise", type=float, default=0.0, help="probability of the simulator sending a noise byte first")
+    parser.add_argument("--output", help="JSON file the results are written to, stdout if not set")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    logger.setLevel("WARNING")
+
+    results = {
+        "driver_version": "%s%s" % (utils.DRIVER_VERSION, utils.DRIVER_SUBVERSION),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "poll_interval": utils.INVERTER_POLL_INTERVAL,
+        "simulator": {"delay": args.delay, "jitter": args.jitter, "drop": args.drop, "corrupt": args.corrupt, "noise": args.noise},
+        "runs": [run(int(baudrate), args) for baudrate in args.baudrates.split(",")],
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
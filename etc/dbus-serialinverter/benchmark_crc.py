@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the Modbus CRC16 of the bundled pymodbus against the byte-at-a-time
+table loop it used before, e.g.:
+
+    ./benchmark_crc.py --sizes 8,64,256 --output crc.json
+"""
+import argparse
+import json
+import os
+import platform
+import struct
+import sys
+import timeit
+
+sys.path.insert(
+    1,
+    os.path.join(
+        os.path.dirname(__file__),
+        "/opt/victronenergy/dbus-serialinverter/pymodbus",
+    ),
+)
+
+from pymodbus.utilities import ModbusCRC, checkFrameCRCs, computeCRC
+
+
+def generate_table():
+    table = []
+    for byte in range(256):
+        crc = 0x0000
+        for _ in range(8):
+            if (byte ^ crc) & 0x0001:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+            byte >>= 1
+        table.append(crc)
+    return table
+
+
+TABLE = generate_table()
+
+
+def compute_crc_bytewise(data):
+    # The previous pymodbus implementation, the reference
+    crc = 0xFFFF
+    for data_byte in data:
+        idx = TABLE[(crc ^ int(data_byte)) & 0xFF]
+        crc = ((crc >> 8) & 0xFF) ^ idx
+    return ((crc << 8) & 0xFF00) | ((crc >> 8) & 0x00FF)
+
+
+def check_frames_bytewise(frames):
+    return [compute_crc_bytewise(frame[:-2]) == struct.unpack(">H", frame[-2:])[0] for frame in frames]
+
+
+def measure(function, number):
+    # Best of 5 runs in microseconds per call
+    return round(min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6, 3)
+
+
+def run(size, args):
+    data = os.urandom(size)
+    if compute_crc_bytewise(data) != computeCRC(data):
+        raise RuntimeError("CRC mismatch at %d bytes" % size)
+
+    # Incremental, the data arriving in chunks of 8 bytes like from a serial port
+    chunks = [data[index:index + 8] for index in range(0, size, 8)]
+
+    def incremental():
+        crc = ModbusCRC()
+        for chunk in chunks:
+            crc.update(chunk)
+        return crc.value
+
+    frames = [data + struct.pack(">H", computeCRC(data))] * args.frames
+    if not all(checkFrameCRCs(frames)):
+        raise RuntimeError("Bulk check failed at %d bytes" % size)
+
+    bytewise = measure(lambda: compute_crc_bytewise(data), args.number)
+    current = measure(lambda: computeCRC(data), args.number)
+    return {
+        "size": size,
+        "bytewise_us": bytewise,
+        "compute_us": current,
+        "speedup": round(bytewise / current, 2),
+        "incremental_us": measure(incremental, args.number),
+        "bulk_bytewise_us_per_frame": round(measure(lambda: check_frames_bytewise(frames), 10) / args.frames, 3),
+        "bulk_us_per_frame": round(measure(lambda: checkFrameCRCs(frames), 10) / args.frames, 3),
+    }
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the Modbus CRC16")
+    parser.add_argument("--sizes", default="8,64,256", help="message sizes in bytes")
+    parser.add_argument("--number", type=int, default=10000, help="calls per measurement")
+    parser.add_argument("--frames", type=int, default=1000, help="frames per bulk check")
+    parser.add_argument("--output", help="JSON file the results are written to, stdout if not set")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "runs": [run(int(size), args) for size in args.sizes.split(",")],
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 #!/usr/bin/env python
 import platform 
+import signal
 import sys
 
 from time import sleep
-from typing import Union
-from threading import Thread
+from typing import Dict, List, Union
 
 from dbus.mainloop.glib import DBusGMainLoop
 
@@ -14,6 +14,9 @@ else:
     from gi.repository import GLib as gobject
 
 from dbushelper import DbusHelper
+from poller import Poller
+from probe import order_candidates, probe_ports
+from serialbus import set_async_mode
 from utils import logger
 import utils
 
@@ -23,7 +26,7 @@ from solis import Solis
 
 supported_inverter_types = [
     {"inverter": Dummy, "baudrate": 0, "slave": 0},
-    {"inverter": Solis, "baudrate": 9600, "slave": 1},
+    {"inverter": Solis, "baudrate": 9600, "slave": utils.INVERTER_ADDRESSES[0]},
 ]
 
 expected_inverter_types = [
@@ -33,56 +36,71 @@ expected_inverter_types = [
 ]
 
 def main():
-    def poll_inverter(loop):
-        # Run in separate thread. Pass in the mainloop so the thread can kill us if there is an exception.
-        poller = Thread(target=lambda: helper.publish_inverter(loop))
-        # Thread will die with us if deamon
-        poller.daemon = True
-        poller.start()
-        return True
-
-    def get_inverter(_port) -> Union[Inverter, None]:
-        # all the different inverters the driver support and need to test for
-        # try to establish communications with the inverter 3 times, else exit
+    def get_inverter_per_port(_ports) -> Dict[str, Inverter]:
+        # all the different inverters the driver support and need to test for, the one found on the last start first
+        # the ports are probed concurrently
+        candidates = {
+            _port: order_candidates(_port, expected_inverter_types) for _port in _ports
+        }
+
+        # try to establish communications with the inverters 3 times
+        found = dict()
         count = 3
-        while count > 0:
-            # create a new inverter object that can read the inverter and run connection test
-            for test in expected_inverter_types:
-                logger.info("Testing " + test["inverter"].__name__)
-                inverterClass = test["inverter"]
-                baudrate = test["baudrate"]
-                inverter: Inverter = inverterClass(
-                    port=_port, baudrate=baudrate, slave=test.get("slave")
-                )
-                if inverter.test_connection():
-                    logger.info(
-                        "Connection established to " + inverter.__class__.__name__
-                    )
-                    return inverter
+        while count > 0 and candidates:
+            for _port, inverter in probe_ports(candidates).items():
+                if inverter is not None:
+                    found[_port] = inverter
+                    del candidates[_port]
             count -= 1
-            sleep(0.5)
-
-        return None
-
-    def get_port() -> str:
-        # Get the port we need to use from the argument
+            if candidates:
+                sleep(0.5)
+
+        for _port in candidates:
+            logger.error("ERROR >>> No inverter connection at " + _port)
+
+        return found
+
+    def get_inverters(_port, inverter) -> List[Inverter]:
+        # the type was detected at the first address, all further addresses on the bus must be of the same type
+        inverters = [inverter]
+        for slave in utils.INVERTER_ADDRESSES[1:]:
+            other: Inverter = inverter.__class__(port=_port, baudrate=inverter.baudrate, slave=slave)
+            if other.test_connection():
+                logger.info("Connection established to %s slave %s" % (other.__class__.__name__, slave))
+                inverters.append(other)
+            else:
+                logger.error("ERROR >>> No inverter connection at %s slave %s" % (_port, slave))
+                other.close()
+
+        return inverters
+
+    def get_ports() -> List[str]:
+        # Get the port(s) we need to use from the arguments
         if len(sys.argv) > 1:
-            return sys.argv[1]
+            return sys.argv[1:]
         else:
             # just for MNB-SPI
             logger.info("No Port needed")
-            return "/dev/tty/USB9"
+            return ["/dev/tty/USB9"]
 
     logger.info("Start dbus-serialinverter");
 
-    port = get_port()
-    inverter: Inverter = get_inverter(port)
+    ports = get_ports()
+    if len(ports) > 1:
+        # One process for all ports, their serial IO runs on a shared asyncio loop
+        logger.info("Serving %d ports from one process" % len(ports))
+        set_async_mode(True)
+
+    inverters: List[Inverter] = []
+    for port, inverter in get_inverter_per_port(ports).items():
+        inverters += get_inverters(port, inverter)
 
-    if inverter is None:
-        logger.error("ERROR >>> No inverter connection at " + port)
+    if not inverters:
+        logger.error("ERROR >>> No inverter connection at " + ", ".join(ports))
         sys.exit(1)
 
-    inverter.log_settings()
+    for inverter in inverters:
+        inverter.log_settings()
 
     # Have a mainloop, so we can send/receive asynchronous calls to and from dbus
     DBusGMainLoop(set_as_default=True)
@@ -90,19 +108,42 @@ def main():
         gobject.threads_init()
     mainloop = gobject.MainLoop()
 
-    # Get the initial values for the inverter used by setup_vedbus
-    helper = DbusHelper(inverter)
-
-    if not helper.setup_vedbus():
-        logger.error("ERROR >>> Problem with inverter set up at " + port)
-        sys.exit(1)
-
-    # Poll the inverter at INTERVAL and run the main loop
-    gobject.timeout_add(inverter.poll_interval, lambda: poll_inverter(mainloop))
+    # Every inverter gets its own dbus service and poll schedule, the pollers of a port share its bus
+    pollers = []
+    for inverter in inverters:
+        # Get the initial values for the inverter used by setup_vedbus
+        helper = DbusHelper(inverter)
+
+        if not helper.setup_vedbus():
+            logger.error("ERROR >>> Problem with inverter set up at %s slave %s" % (inverter.port, inverter.slave))
+            sys.exit(1)
+
+        # Poll the inverter at INTERVAL in a dedicated thread.
+        # Pass in the mainloop so the poller can kill us if there is an exception.
+        pollers.append(Poller(helper, mainloop))
+
+    # VenusOS stops the driver with SIGTERM, quit the mainloop so the pollers are stopped and the
+    # recorder and energy counters are flushed below
+    def on_sigterm(*args):
+        logger.info("SIGTERM received, stopping")
+        mainloop.quit()
+        return False
+
+    if hasattr(gobject, "unix_signal_add"):
+        gobject.unix_signal_add(gobject.PRIORITY_HIGH, signal.SIGTERM, on_sigterm)
+    else:
+        signal.signal(signal.SIGTERM, on_sigterm)
+
+    for poller in pollers:
+        poller.start()
     try:
         mainloop.run()
     except KeyboardInterrupt:
         pass
+    for poller in pollers:
+        poller.stop()
+    for poller in pollers:
+        poller.helper.close()
 
 if __name__ == "__main__":
     main()
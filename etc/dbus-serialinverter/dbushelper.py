@@ -3,7 +3,7 @@ import sys
 import os
 import platform
 import dbus
-import traceback
+from time import monotonic, time
 
 # Victron packages
 sys.path.insert(
@@ -17,31 +17,62 @@ sys.path.insert(
 from vedbus import VeDbusService
 from settingsdevice import SettingsDevice
 import inverter
+from publisher import get_change_filter
+from poller import ControlWriter
+from metrics import DEBUG_PATHS, PollMetrics
+from history import History, parse_resolutions, serve_history
+from recorder import Recorder, get_record_path
 
 from utils import logger
 import utils
 
-def get_bus():
+def get_bus(private=False):
     return (
-        dbus.SessionBus()
+        dbus.SessionBus(private=private)
         if "DBUS_SESSION_BUS_ADDRESS" in os.environ
-        else dbus.SystemBus()
+        else dbus.SystemBus(private=private)
     )
 
+def get_device_id(inverter):
+    # ttyUSB0, or ttyUSB0_2 for slave 2 if several inverters share the port
+    short_port = inverter.port[inverter.port.rfind("/") + 1 :]
+    if len(utils.INVERTER_ADDRESSES) > 1:
+        return "%s_%s" % (short_port, inverter.slave)
+    return short_port
+
 class DbusHelper:
-    def __init__(self, inverter):
+    def __init__(self, inverter, dbusservice=None):
         self.inverter = inverter
+        self.device_id = get_device_id(inverter)
         self.instance = 1
         self.settings = None
         self.error_count = 0
-        self._dbusservice = VeDbusService(
-            "com.victronenergy.pvinverter."
-            + self.inverter.port[self.inverter.port.rfind("/") + 1 :],
-            get_bus(),
+        self.sleeping = False
+        self.dark_since = None
+        self.change_filter = get_change_filter()
+        self.control_writer = ControlWriter(inverter)
+        bus = getattr(inverter, "bus", None)
+        self.metrics = PollMetrics(
+            self.device_id, bus.metrics if bus is not None else None, bus.client if bus is not None else None
         )
+        self.debug_values = dict()
+        self.history = History(parse_resolutions(utils.HISTORY_RESOLUTIONS))
+        self.recorder = None
+        if utils.RECORDER_DIRECTORY:
+            self.recorder = Recorder(
+                get_record_path(self.device_id), utils.RECORDER_FLUSH_INTERVAL, utils.RECORDER_MAX_SIZE, utils.RECORDER_FILES
+            )
+        # Every service gets its own connection, so several inverters can be published from one process.
+        # A service can be passed in instead, e.g. a stub by benchmark.py
+        if dbusservice is None:
+            dbusservice = VeDbusService(
+                "com.victronenergy.pvinverter." + self.device_id,
+                get_bus(private=True),
+            )
+        self._dbusservice = dbusservice
 
     def setup_instance(self):
-        inverter_id = self.inverter.port[self.inverter.port.rfind("/") + 1 :]
+        inverter_id = self.device_id
         path = "/Settings/Devices/serialinverter"
         default_instance = "inverter:20" # pvinverters from 20-29
         settings = {
@@ -84,8 +115,7 @@ class DbusHelper:
         # and notify of all the attributes we intend to update
         # This is only called once when a inverter is initiated
         self.setup_instance()
-        short_port = self.inverter.port[self.inverter.port.rfind("/") + 1 :]
-        logger.info("%s" % ("com.victronenergy.pvinverter." + short_port))
+        logger.info("%s" % ("com.victronenergy.pvinverter." + self.device_id))
 
         # Get the settings for the inverter
         if not self.inverter.get_settings():
@@ -96,7 +126,7 @@ class DbusHelper:
         self._dbusservice.add_path(
             "/Mgmt/ProcessVersion", "Python " + platform.python_version()
         )
-        self._dbusservice.add_path("/Mgmt/Connection", "Serial " + self.inverter.port)
+        self._dbusservice.add_path("/Mgmt/Connection", "Serial %s (slave %s)" % (self.inverter.port, self.inverter.slave))
 
         # Create the mandatory objects
         self._dbusservice.add_path("/DeviceInstance", self.instance)
@@ -133,8 +163,19 @@ class DbusHelper:
         self._dbusservice.add_path("/Ac/Power", 0, gettextcallback=self.gettextforW)
         self._dbusservice.add_path("/Ac/Energy/Forward", 0, gettextcallback=self.gettextforkWh)
         
-        # FIXME: This is killing zero feed-in regulation
-        self._dbusservice.add_path('/Ac/PowerLimit', self.inverter.energy_data['overall']['power_limit'], gettextcallback=self.gettextforW)
+        # Changes are written to the inverter right away by the control writer, not with the next poll
+        self._dbusservice.add_path('/Ac/PowerLimit', self.inverter.energy_data.overall.power_limit, writeable=True,
+                                   gettextcallback=self.gettextforW, onchangecallback=self.handle_power_limit_change)
+        self.control_writer.start()
+
+        # Poll and bus timing, updated every DEBUG_SUMMARY_INTERVAL seconds
+        for path in DEBUG_PATHS:
+            self._dbusservice.add_path(path, None)
+
+        if utils.HISTORY_SOCKET_DIR:
+            serve_history(self.history, self.device_id)
+        if self.recorder is not None:
+            self.recorder.start()
 
         logger.info(f"Publish config values = {utils.PUBLISH_CONFIG_VALUES}")
         if utils.PUBLISH_CONFIG_VALUES == 1:
@@ -142,58 +183,135 @@ class DbusHelper:
 
         return True
 
-    def publish_inverter(self, loop):
-        # This is called every inverter.poll_interval milli second as set up per inverter type to read and update the data
-        self.inverter.energy_data['overall']['power_limit'] = self._dbusservice['/Ac/PowerLimit']
-        try:
-            # Call the inverter's refresh_data function
-            success = self.inverter.refresh_data()
-            if success:
-                self.error_count = 0
-                self.inverter.online = True
-                self.inverter.poll_interval = utils.INVERTER_POLL_INTERVAL
+    def handle_power_limit_change(self, path, value):
+        # Called from the main loop when e.g. the ESS loop changes the limit
+        if value is None:
+            return False
+        self.inverter.energy_data.overall.power_limit = float(value)
+        self.control_writer.submit()
+        return True
+
+    def refresh_inverter(self):
+        # This is called from the poller thread every inverter.poll_interval milli second as set up per inverter type to read the data
+        # Returns the snapshot to publish, it is kept in the history and recorded as well
+        snapshot = self.poll_inverter()
+        timestamp = time()
+        self.history.add(timestamp, snapshot)
+        if self.recorder is not None:
+            self.recorder.add(timestamp, snapshot)
+        return snapshot
+
+    def close(self):
+        # Called when the driver exits, the records buffered since the last write would be lost otherwise
+        if self.recorder is not None:
+            self.recorder.close()
+        self.inverter.save_state()
+
+    def poll_inverter(self):
+        # The driver keeps running while the inverter is offline
+        # energy_data.overall.power_limit is kept up to date by handle_power_limit_change
+        if self.sleeping:
+            return self.probe_inverter()
+
+        # Call the inverter's refresh_data function
+        started = monotonic()
+        success = self.inverter.refresh_data()
+        now = monotonic()
+        self.metrics.record(now - started)
+        summary = self.metrics.summarize(now)
+        if summary is not None:
+            # Swapped as a whole, publish_dbus() runs in the main loop
+            self.debug_values = summary
+        if success:
+            self.error_count = 0
+            self.inverter.online = True
+            # Dark for SLEEP_AFTER seconds, e.g. after sunset
+            if self.inverter.is_dark():
+                if self.dark_since is None:
+                    self.dark_since = now
+                elif now - self.dark_since >= utils.INVERTER_SLEEP_AFTER:
+                    return self.fall_asleep("no DC power")
             else:
-                self.error_count += 1
-                # If the inverter is offline for more than 10 polls (polled every second for most inverters)
-                if self.error_count >= 10:
-                    self.inverter.online = False
-                # If the inverter is offline for more than 60 polls, quit. VenusOS will restart the driver anyway.
-                if self.error_count >= 60:
-                    logger.warn("Inverter seems to be offline, quitting!")
-                    loop.quit()
-
-            # Publish all the data from the inverter object to dbus
-            self.publish_dbus()
-
-        except:
-            traceback.print_exc()
-            loop.quit()
-
-    def publish_dbus(self):
-        self._dbusservice['/StatusCode'] = self.inverter.status
-
-        self._dbusservice['/Ac/L1/Voltage'] = self.inverter.energy_data['L1']['ac_voltage']
-        self._dbusservice['/Ac/L1/Current'] = self.inverter.energy_data['L1']['ac_current']
-        self._dbusservice['/Ac/L1/Power'] = self.inverter.energy_data['L1']['ac_power']
-        self._dbusservice['/Ac/L1/Energy/Forward'] = self.inverter.energy_data['L1']['energy_forwarded']
-        
-        self._dbusservice['/Ac/L2/Voltage'] = self.inverter.energy_data['L2']['ac_voltage']
-        self._dbusservice['/Ac/L2/Current'] = self.inverter.energy_data['L2']['ac_current']
-        self._dbusservice['/Ac/L2/Power'] = self.inverter.energy_data['L2']['ac_power']
-        self._dbusservice['/Ac/L2/Energy/Forward'] = self.inverter.energy_data['L2']['energy_forwarded']
-        
-        self._dbusservice['/Ac/L3/Voltage'] = self.inverter.energy_data['L3']['ac_voltage']
-        self._dbusservice['/Ac/L3/Current'] = self.inverter.energy_data['L3']['ac_current']
-        self._dbusservice['/Ac/L3/Power'] = self.inverter.energy_data['L3']['ac_power']
-        self._dbusservice['/Ac/L3/Energy/Forward'] = self.inverter.energy_data['L3']['energy_forwarded']
+                self.dark_since = None
+        else:
+            self.error_count += 1
+            # If the inverter is offline for more than 10 polls (polled every second for most inverters)
+            if self.error_count >= 10:
+                self.inverter.online = False
+            # If the inverter is offline for more than 60 polls, it's sleeping.
+            # Restarting the driver would reload everything and probe the ports again, e.g. all night long.
+            if self.error_count >= 60:
+                return self.fall_asleep("no response")
+
+        return self.inverter.publish_snapshot()
+
+    def fall_asleep(self, reason):
+        # Stop polling, only wake probes are sent until the inverter is awake again
+        logger.info("Inverter is sleeping (%s), probing every %d ms at most" % (reason, utils.INVERTER_RECONNECT_INTERVAL_MAX))
+        self.sleeping = True
+        self.dark_since = None
+        self.inverter.fall_asleep()
+        return self.inverter.publish_snapshot()
+
+    def probe_inverter(self):
+        # Called instead of a poll while sleeping. The published snapshot stays frozen, only /Connected follows the probes.
+        awake = self.inverter.wake_probe()
+        if awake:
+            logger.info("Inverter woke up, polling every %d ms" % utils.INVERTER_POLL_INTERVAL)
+            self.sleeping = False
+            self.error_count = 0
+            self.inverter.online = True
+            self.inverter.poll_interval = utils.INVERTER_POLL_INTERVAL
+            self.inverter.reset_tiers()
+            return self.inverter.publish_snapshot()
+
+        self.inverter.online = awake is not None
+        if awake is None:
+            # Reopen the connection, e.g. in case the adapter was plugged in again
+            self.inverter.reconnect()
+        self.inverter.poll_interval = min(self.inverter.poll_interval * 2, utils.INVERTER_RECONNECT_INTERVAL_MAX)
+        logger.debug("Next wake probe in %d ms" % self.inverter.poll_interval)
+        return self.inverter.publish_snapshot()
+
+    def publish_dbus(self, snapshot):
+        # Publish a snapshot from the inverter object to dbus, this runs in the main loop.
+        # Only paths which changed beyond their deadband are written, grouped into one ItemsChanged signal.
+        changed = self.change_filter.changes({
+            **self.debug_values,
+
+            '/Connected': int(snapshot.online),
+            '/StatusCode': snapshot.status,
+
+            '/Ac/L1/Voltage': snapshot.L1.ac_voltage,
+            '/Ac/L1/Current': snapshot.L1.ac_current,
+            '/Ac/L1/Power': snapshot.L1.ac_power,
+            '/Ac/L1/Energy/Forward': snapshot.L1.energy_forwarded,
+
+            '/Ac/L2/Voltage': snapshot.L2.ac_voltage,
+            '/Ac/L2/Current': snapshot.L2.ac_current,
+            '/Ac/L2/Power': snapshot.L2.ac_power,
+            '/Ac/L2/Energy/Forward': snapshot.L2.energy_forwarded,
+
+            '/Ac/L3/Voltage': snapshot.L3.ac_voltage,
+            '/Ac/L3/Current': snapshot.L3.ac_current,
+            '/Ac/L3/Power': snapshot.L3.ac_power,
+            '/Ac/L3/Energy/Forward': snapshot.L3.energy_forwarded,
+
+            '/Ac/Power': snapshot.overall.ac_power,
+            '/Ac/Energy/Forward': snapshot.overall.energy_forwarded,
+        })
+
+        if not changed:
+            return
 
-        self._dbusservice['/Ac/Power'] = self.inverter.energy_data['overall']['ac_power']
-        self._dbusservice['/Ac/Energy/Forward'] = self.inverter.energy_data['overall']['energy_forwarded']
+        with self._dbusservice as service:
+            for path, value in changed.items():
+                service[path] = value
 
-        # Increment UpdateIndex - to show that new data is available
-        index = self._dbusservice['/UpdateIndex'] + 1  # increment index
-        if index > 255:   # Maximum value of the index
-            index = 0       # Overflow from 255 to 0
-        self._dbusservice['/UpdateIndex'] = index
+            # Increment UpdateIndex - to show that new data is available
+            index = self._dbusservice['/UpdateIndex'] + 1  # increment index
+            if index > 255:   # Maximum value of the index
+                index = 0       # Overflow from 255 to 0
+            service['/UpdateIndex'] = index
 
-        logger.debug("published to dbus [%s]" % str(self.inverter.energy_data['overall']['ac_power']))
\ No newline at end of file
+        logger.debug("published %d path(s) to dbus [%s]" % (len(changed), str(snapshot.overall.ac_power)))
@@ -31,7 +31,7 @@ class Dummy(Inverter):
             self.serial_number = 12345678
 
 	       # Power limit
-            self.energy_data['overall']['power_limit'] = utils.INVERTER_MAX_AC_POWER
+            self.energy_data.overall.power_limit = utils.INVERTER_MAX_AC_POWER
         
             return True
         else:
@@ -46,25 +46,25 @@ class Dummy(Inverter):
 
     def read_status_data(self):
         # Energy data
-        power = self.energy_data['overall']['power_limit']
+        power = self.energy_data.overall.power_limit
         
-        self.energy_data["L1"]['ac_voltage'] = 230.0
-        self.energy_data["L1"]['ac_current'] = power / 230
-        self.energy_data["L1"]['ac_power'] = power
-        self.energy_data["L1"]['energy_forwarded'] = 0.1
+        self.energy_data.L1.ac_voltage = 230.0
+        self.energy_data.L1.ac_current = power / 230
+        self.energy_data.L1.ac_power = power
+        self.energy_data.L1.energy_forwarded = 0.1
 
-        self.energy_data["L2"]['ac_voltage'] = 0.0
-        self.energy_data["L2"]['ac_current'] = 0.0
-        self.energy_data["L2"]['ac_power'] = 0.0
-        self.energy_data["L2"]['energy_forwarded'] = 0.0
+        self.energy_data.L2.ac_voltage = 0.0
+        self.energy_data.L2.ac_current = 0.0
+        self.energy_data.L2.ac_power = 0.0
+        self.energy_data.L2.energy_forwarded = 0.0
             
-        self.energy_data["L3"]['ac_voltage'] = 0.0
-        self.energy_data["L3"]['ac_current'] = 0.0
-        self.energy_data["L3"]['ac_power'] = 0.0
-        self.energy_data["L3"]['energy_forwarded'] = 0.0
+        self.energy_data.L3.ac_voltage = 0.0
+        self.energy_data.L3.ac_current = 0.0
+        self.energy_data.L3.ac_power = 0.0
+        self.energy_data.L3.energy_forwarded = 0.0
 
-        self.energy_data['overall']['ac_power'] = power
-        self.energy_data['overall']['energy_forwarded'] = 0.1
+        self.energy_data.overall.ac_power = power
+        self.energy_data.overall.energy_forwarded = 0.1
 
         self.status = 7
 
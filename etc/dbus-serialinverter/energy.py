@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from time import monotonic
+from typing import List, Sequence
+
+from utils import logger
+import utils
+
+
+def get_state_path(port, slave) -> str:
+    short_port = port[port.rfind("/") + 1 :]
+    return os.path.join(utils.ENERGY_STATE_DIRECTORY, "energy_%s_%s.json" % (short_port, slave))
+
+
+def split_power(ac_power: float, voltages: Sequence[float], currents: Sequence[float]) -> List[float]:
+    """
+    Split the measured AC power of a 3-phase inverter by the apparent power (V * I) of each phase,
+    so the phase powers add up to the total reported by the inverter.
+    """
+    apparent = [voltage * current for voltage, current in zip(voltages, currents)]
+    total = sum(apparent)
+    if total <= 0:
+        return [0.0 for _ in apparent]
+    return [ac_power * value / total for value in apparent]
+
+
+def get_shares(values: Sequence[float]) -> List[float]:
+    # Fraction of the sum per value, equal fractions if there is nothing to go by
+    total = sum(values)
+    if total <= 0:
+        return [1 / len(values)] * len(values)
+    return [value / total for value in values]
+
+
+class EnergyIntegrator:
+    """
+    Per-phase energy counters (kWh) of an inverter which only reports its total energy.
+
+    The phase powers of every poll are integrated with the trapezoidal rule. Whenever the inverter's
+    total energy register is read, the increase of the register since the last reconciliation is
+    distributed over the phases in proportion to the integrated energy, so the phase counters add up
+    to the register at every reconciliation and never drift. The counters are persisted every PERSIST_INTERVAL seconds
+    and when the driver exits, a write is a small JSON file replaced atomically.
+    """
+
+    def __init__(self, path, phases=3):
+        self.path = path
+        self.energy = [0.0] * phases # reconciled counters
+        self.pending = [0.0] * phases # integrated since the last reconciliation
+        self.total = None # register value of the last reconciliation
+        self._last_time = None
+        self._last_power = None
+        self._published = [0.0] * phases
+        self._dirty = False
+        self._saved = monotonic()
+        self.load()
+
+    def add(self, now: float, power: Sequence[float]) -> None:
+        """
+        Integrate the phase powers (W) sampled at now (monotonic seconds).
+        Samples further apart than MAX_GAP, e.g. after the night, are not integrated.
+        """
+        if self._last_time is not None and 0 < now - self._last_time <= utils.ENERGY_MAX_GAP:
+            hours = (now - self._last_time) / 3600
+            for index, value in enumerate(power):
+                self.pending[index] += (self._last_power[index] + value) / 2 * hours / 1000
+        self._last_time = now
+        self._last_power = list(power)
+
+    def reconcile(self, total: float) -> None:
+        """
+        Bring the phase counters in line with the inverter's total energy register (kWh).
+        """
+        if self.total is None or total < self.total:
+            # First reading without a saved state, or the register was reset: keep the split
+            # of the counters seen so far, assume balanced phases if there is none
+            self.energy = [total * share for share in get_shares(self.energy)]
+            if self.total is not None:
+                logger.info("Total energy register went back from %s to %s kWh" % (self.total, total))
+        else:
+            delta = total - self.total
+            integrated = sum(self.pending)
+            # Without integrated energy, e.g. produced while the driver was not running, keep the split
+            shares = get_shares(self.pending if integrated > 0 else self.energy)
+            self.energy = [value + delta * share for value, share in zip(self.energy, shares)]
+            logger.debug("Energy reconciled: register +%.2f kWh, integrated %.3f kWh" % (delta, integrated))
+
+        self._dirty = self._dirty or total != self.total
+        self.total = total
+        self.pending = [0.0] * len(self.pending)
+        # Publish the reconciled counters as they are, even if one goes back a little
+        self._published = [0.0] * len(self.energy)
+
+        if self._dirty and monotonic() - self._saved >= utils.ENERGY_PERSIST_INTERVAL:
+            self.save()
+
+    def phase_energy(self) -> List[float]:
+        """
+        :return: the energy counter of every phase, including the energy integrated since the last reconciliation.
+            Between reconciliations a counter never goes back, at a reconciliation the counters are set
+            to the reconciled values which add up to the register.
+        """
+        if self.total is None:
+            return [None] * len(self.energy)
+        self._published = [
+            max(published, round(value + pending, 3))
+            for published, value, pending in zip(self._published, self.energy, self.pending)
+        ]
+        return self._published
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as file:
+                state = json.load(file)
+            if len(state["energy"]) == len(self.energy):
+                self.energy = [float(value) for value in state["energy"]]
+                self.total = state["total"]
+                logger.info("Energy counters restored from %s: %s" % (self.path, self.energy))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Energy counters in %s not restored: %s" % (self.path, e))
+
+    def save(self) -> None:
+        self._saved = monotonic()
+        if self.total is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temporary = self.path + ".tmp"
+            with open(temporary, "w") as file:
+                json.dump({"energy": self.energy, "total": self.total}, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.error("Energy counters not saved to %s: %s" % (self.path, e))
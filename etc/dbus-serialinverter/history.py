@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import socket
+import sys
+from array import array
+from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+from threading import Lock, Thread
+from typing import Dict, List, Tuple
+
+from utils import logger
+import utils
+
+# Values kept per sample, read from an EnergySnapshot
+CHANNELS = (
+    "ac_power",
+    "energy_forwarded",
+    "L1_power",
+    "L2_power",
+    "L3_power",
+    "L1_voltage",
+    "L2_voltage",
+    "L3_voltage",
+)
+# Counters are sampled (last value of a bucket), all other channels are averaged
+COUNTERS = ("energy_forwarded",)
+
+
+def parse_resolutions(value: str) -> List[Tuple[int, int]]:
+    """
+    Parse the resolutions from config, e.g. "1:600,60:1440" for 600 rows of 1 s and 1440 rows of 1 min.
+
+    :return: (step in seconds, rows) per resolution
+    """
+    resolutions = []
+    for resolution in value.split(","):
+        step, length = resolution.split(":")
+        resolutions.append((int(step), int(length)))
+    return resolutions
+
+
+class Resolution:
+    """
+    A ring buffer of rows at a fixed step. Samples are accumulated into the bucket of their step
+    and written as one row when the next bucket starts. All storage is a single preallocated array
+    of doubles, a row is the bucket start time followed by one value per channel.
+    """
+
+    def __init__(self, step: int, length: int):
+        self.step = step
+        self.length = length
+        self.width = 1 + len(CHANNELS)
+        self.rows = array("d", bytes(8 * self.width * length))
+        self.count = 0 # rows written, the oldest row is overwritten once count > length
+        self.bucket = None
+        self.sums = array("d", bytes(8 * len(CHANNELS)))
+        self.samples = 0
+        self.counters = tuple(CHANNELS.index(channel) for channel in COUNTERS)
+
+    def add(self, timestamp: float, values) -> None:
+        bucket = int(timestamp // self.step)
+        if bucket != self.bucket:
+            self.flush()
+            self.bucket = bucket
+
+        for index, value in enumerate(values):
+            if index in self.counters:
+                self.sums[index] = value
+            else:
+                self.sums[index] += value
+        self.samples += 1
+
+    def flush(self) -> None:
+        # Write the accumulated bucket as a row
+        if not self.samples:
+            return
+
+        offset = (self.count % self.length) * self.width
+        self.rows[offset] = self.bucket * self.step
+        for index in range(len(CHANNELS)):
+            value = self.sums[index]
+            self.rows[offset + 1 + index] = value if index in self.counters else value / self.samples
+            self.sums[index] = 0.0
+        self.samples = 0
+        self.count += 1
+
+    def query(self, since: float = 0) -> List[List[float]]:
+        """
+        :return: the rows starting at since, oldest first
+        """
+        rows = []
+        for position in range(max(0, self.count - self.length), self.count):
+            offset = (position % self.length) * self.width
+            if self.rows[offset] >= since:
+                rows.append([round(value, 3) for value in self.rows[offset:offset + self.width]])
+        return rows
+
+
+class History:
+    """
+    Recent samples of one inverter at several resolutions, e.g. 1 s for 10 minutes, 1 min for
+    24 hours and 15 min for 30 days. Every sample is added to all resolutions, so the memory
+    needed is fixed at startup.
+    """
+
+    def __init__(self, resolutions: List[Tuple[int, int]]):
+        self.resolutions = {step: Resolution(step, length) for step, length in resolutions}
+        self._lock = Lock()
+
+    def add(self, timestamp: float, snapshot) -> None:
+        values = (
+            snapshot.overall.ac_power or 0,
+            snapshot.overall.energy_forwarded or 0,
+            snapshot.L1.ac_power or 0,
+            snapshot.L2.ac_power or 0,
+            snapshot.L3.ac_power or 0,
+            snapshot.L1.ac_voltage or 0,
+            snapshot.L2.ac_voltage or 0,
+            snapshot.L3.ac_voltage or 0,
+        )
+        with self._lock:
+            for resolution in self.resolutions.values():
+                resolution.add(timestamp, values)
+
+    def query(self, step: int, since: float = 0) -> Dict:
+        """
+        :return: the rows of the resolution with step seconds
+        """
+        with self._lock:
+            resolution = self.resolutions.get(step)
+            if resolution is None:
+                return {"error": "Unknown resolution %s, available: %s" % (step, sorted(self.resolutions))}
+            return {"resolution": step, "columns": ("time",) + CHANNELS, "rows": resolution.query(since)}
+
+
+class HistoryRequestHandler(StreamRequestHandler):
+    """
+    Answers one request per connection. The request is a line of JSON, e.g. {"resolution": 60, "since": 1700000000},
+    the response is a line of JSON.
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline() or "{}")
+            response = self.server.history.query(int(request.get("resolution", 1)), float(request.get("since", 0)))
+        except (ValueError, AttributeError, TypeError) as e:
+            # e.g. {"resolution": null} or a request which is not a JSON object
+            response = {"error": "Invalid request: %s" % e}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+def get_socket_path(device_id) -> str:
+    return os.path.join(utils.HISTORY_SOCKET_DIR, "serialinverter_%s.sock" % device_id)
+
+
+def serve_history(history: History, device_id) -> ThreadingUnixStreamServer:
+    """
+    Serve queries of history on a local unix socket in a daemon thread.
+    """
+    path = get_socket_path(device_id)
+    if os.path.exists(path):
+        os.remove(path)
+    server = ThreadingUnixStreamServer(path, HistoryRequestHandler)
+    server.daemon_threads = True
+    server.history = history
+    Thread(target=server.serve_forever, name="history", daemon=True).start()
+    logger.info("Serving history on %s" % path)
+    return server
+
+
+def query_history(path, resolution, since=0) -> Dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(json.dumps({"resolution": resolution, "since": since}).encode() + b"\n")
+        with client.makefile("rb") as response:
+            return json.loads(response.readline())
+
+
+if __name__ == "__main__":
+    # history.py <socket> [resolution] [since], e.g. history.py /run/serialinverter_ttyUSB0.sock 60
+    print(json.dumps(query_history(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 1,
+                                   float(sys.argv[3]) if len(sys.argv) > 3 else 0), indent=2))
@@ -6,9 +6,13 @@ import utils
 import logging
 import math
 from datetime import timedelta
-from time import time
+from time import time, monotonic
 from abc import ABC, abstractmethod
 
+from registers import Field, RegisterBlock, RegisterMap, TIER_FAST, TIER_SLOW, TIER_STATIC
+from serialbus import StaleRequest, PRIORITY_TELEMETRY, PRIORITY_STATIC
+from snapshot import EnergySnapshot
+
 class Inverter(ABC):
     """
     This Class is the abstract baseclass for all inverters. For each inverter this class needs to be extended
@@ -35,22 +39,22 @@ class Inverter(ABC):
         
         self.status = None
 
-        # Energy data
-        self.energy_data = dict()
-        
-        for phase in ['L1', 'L2', 'L3']:
-            self.energy_data[phase] = dict()
-            self.energy_data[phase]['ac_voltage'] = None
-            self.energy_data[phase]['ac_current'] = None
-            self.energy_data[phase]['ac_power'] = None
-            self.energy_data[phase]['energy_forwarded'] = None
-
-        self.energy_data["overall"] = dict()
-        self.energy_data['overall']['ac_power'] = None
-        self.energy_data['overall']['energy_forwarded'] = None
-        
-        self.energy_data['overall']['power_limit'] = None
-        self.energy_data['overall']['active_power_limit'] = None
+        # Energy data, filled by the poller. Readers use the last published snapshot.
+        self.energy_data = EnergySnapshot()
+        self.snapshot = EnergySnapshot()
+
+        # Register map of drivers built on the register map engine, read by read_due_registers()
+        self.register_fields: List[Field] = []
+        self.register_values = dict()
+
+        # Poll period of each tier in milli seconds, the fast tier is read on every poll
+        self.tier_periods = {
+            TIER_FAST: 0,
+            TIER_SLOW: utils.INVERTER_POLL_INTERVAL_SLOW,
+            TIER_STATIC: utils.INVERTER_POLL_INTERVAL_STATIC,
+        }
+        self._tier_due = dict()
+        self._register_maps = dict()
 
     @abstractmethod
     def test_connection(self) -> bool:
@@ -84,6 +88,173 @@ class Inverter(ABC):
         """
         return False
 
+    def publish_snapshot(self) -> EnergySnapshot:
+        """
+        Publish a copy of energy_data as the new snapshot after a poll. Swapping the reference is atomic,
+        so readers in other threads always see a complete poll.
+        """
+        snapshot = self.energy_data.copy()
+        snapshot.status = self.status
+        snapshot.online = self.online
+        self.snapshot = snapshot
+        return snapshot
+
+    def apply_power_limit(self, urgent=False) -> bool:
+        """
+        Drivers which can limit their power override this function to write energy_data.overall.power_limit
+        to the inverter right away. It is called from the control writer as soon as the limit changes on dbus.
+
+        :return: true if the limit is active
+        """
+        return True
+
+    def reconnect(self) -> None:
+        """
+        Called by DbusHelper for every wake probe which got no answer. All tiers are read again
+        on the first poll after reconnecting, the inverter may have restarted meanwhile.
+        Drivers talking to a bus extend this function to reopen their connection.
+        """
+        self.reset_tiers()
+
+    def reset_tiers(self) -> None:
+        # Read all tiers on the next poll
+        self._tier_due.clear()
+
+    def is_dark(self) -> bool:
+        """
+        Drivers which read the DC side override this function to tell if the inverter has no power
+        to feed in, e.g. at night. It is called after every successful poll.
+
+        :return: true if there is no AC power and too little DC voltage
+        """
+        return False
+
+    def wake_probe(self) -> Union[bool, None]:
+        """
+        Called instead of refresh_data() while the inverter sleeps. Drivers override this function
+        with a single cheap request.
+
+        :return: None if the inverter didn't answer, else whether it is awake and polls can resume
+        """
+        return True if self.refresh_data() else None
+
+    def fall_asleep(self) -> None:
+        """
+        Freeze energy_data for the night: no power and no current, the energy counters are kept.
+        """
+        for phase in self.energy_data.phases():
+            phase.ac_current = 0.0
+            phase.ac_power = 0.0
+        self.energy_data.overall.ac_power = 0.0
+        self.status = 8 # Standby
+
+    def set_timeout(self, timeout: Union[float, None]) -> None:
+        """
+        Drivers talking to a bus override this function to change their request timeout,
+        e.g. to probe with a short timeout. None restores the driver's default timeout.
+        """
+        return
+
+    def close(self) -> None:
+        """
+        Drivers talking to a bus override this function to release it, e.g. after a failed probe.
+        """
+        return
+
+    def save_state(self) -> None:
+        """
+        Drivers keeping state across restarts override this function to write it, it is called
+        when the driver exits.
+        """
+        return
+
+    def read_block(self, block: RegisterBlock, priority=PRIORITY_TELEMETRY, deadline=None) -> Union[List[int], None]:
+        """
+        Drivers built on a register map override this function to fetch the registers of
+        a single block with one bus request of the given priority class. Without an override
+        nothing is read and the poll fails.
+
+        :return: the raw registers, None on failure
+        :raises StaleRequest: if the request was dropped because it would finish after deadline
+        """
+        return None
+
+    def read_register_map(self, register_map: RegisterMap, deadline=None, priority=None) -> Tuple[bool, bool, dict]:
+        """
+        Read and decode all blocks of a register map. Fields with a path are written to energy_data,
+        all decoded fields are returned by name. Fields of blocks which failed or were dropped are missing.
+
+        Blocks with fast tier fields are telemetry and are dropped once they would finish after deadline,
+        fields of dropped blocks keep their previous value. Fields of failed blocks are reset to 0 in
+        energy_data and removed from register_values. All other blocks have static priority.
+        If priority is given, all blocks are read with it and none is dropped.
+
+        :return: the success state, whether all blocks were read and the decoded values
+        """
+        success = True
+        complete = True
+        values = dict()
+        for index, block in enumerate(register_map.blocks):
+            if priority is not None:
+                block_priority, block_deadline = priority, None
+            elif TIER_FAST in register_map.block_tiers[index]:
+                block_priority, block_deadline = PRIORITY_TELEMETRY, deadline
+            else:
+                block_priority, block_deadline = PRIORITY_STATIC, None
+
+            try:
+                registers = self.read_block(block, block_priority, block_deadline)
+            except StaleRequest as e:
+                logger.debug(e)
+                complete = False
+                continue
+
+            if registers is None:
+                success = False
+                register_map.clear(index, self.energy_data, self.register_values)
+                continue
+            register_map.decode(index, registers, values, self.energy_data)
+
+        return success, complete, values
+
+    def due_tiers(self, now) -> frozenset:
+        # A tier is due if its period has passed or will pass before the next poll
+        horizon = now + self.poll_interval / 2000
+        return frozenset(
+            tier for tier in set(field.tier for field in self.register_fields)
+            if self._tier_due.get(tier, 0) <= horizon
+        )
+
+    def read_due_registers(self) -> Tuple[bool, dict]:
+        """
+        Read the fields of all tiers which are due on this poll. Fields due together are merged into
+        shared bus requests, the compiled register map of each tier combination is cached.
+        The latest value of every field is kept in register_values, fields of failed blocks are removed.
+
+        :return: the success state and the values read on this poll
+        """
+        now = monotonic()
+        tiers = self.due_tiers(now)
+
+        register_map = self._register_maps.get(tiers)
+        if register_map is None:
+            register_map = RegisterMap(
+                [field for field in self.register_fields if field.tier in tiers], utils.INVERTER_REGISTER_GAP
+            )
+            self._register_maps[tiers] = register_map
+            logger.info("Reading tier(s) %s with %d request(s): %s" % (sorted(tiers), len(register_map.blocks), register_map.blocks))
+
+        # Telemetry which can't be read before the next poll is due is stale
+        success, complete, values = self.read_register_map(register_map, now + self.poll_interval / 1000)
+        self.register_values.update(values)
+
+        # Tiers which could not be read stay due and are retried on the next poll
+        if success and complete:
+            for tier in tiers:
+                self._tier_due[tier] = now + self.tier_periods.get(tier, 0) / 1000
+
+        return success, values
+
     def log_settings(self) -> None:
         logger.info(f"Inverter {self.type} connected to dbus from {self.port}")
         logger.info("=== Settings ===")
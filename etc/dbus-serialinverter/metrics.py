@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+from bisect import bisect_left
+from threading import Lock
+from time import monotonic
+from typing import Dict, Union
+
+from utils import logger
+import utils
+
+# Cumulative counters of the Modbus client, published as the increase per summary interval
+CLIENT_COUNTERS = (
+    ("/Debug/Bus/Retries", "retry_count"),
+    ("/Debug/Bus/Timeouts", "timeout_count"),
+    ("/Debug/Bus/CrcErrors", "crc_error_count"),
+    ("/Debug/Bus/Resyncs", "resync_count"),
+)
+
+# Upper bucket bounds in milliseconds, shared by all timing histograms
+TIMING_BOUNDS_MS = (1, 2, 5, 10, 15, 20, 30, 40, 50, 75, 100, 150, 200, 300, 500, 750, 1000, 2000, 5000)
+
+
+class Histogram:
+    """
+    Fixed bucket histogram of durations in milliseconds. All storage is allocated up front,
+    recording a value is a bisect and a few additions.
+    """
+
+    def __init__(self, bounds=TIMING_BOUNDS_MS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.min = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.last = value
+        if value < self.min or self.count == 1:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        """
+        :return: the upper bound of the bucket holding the given fraction of the values,
+            the largest value for the overflow bucket
+        """
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank and seen > 0:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return 0.0
+
+    def reset(self) -> None:
+        for index in range(len(self.buckets)):
+            self.buckets[index] = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = 0.0
+        self.max = 0.0
+
+
+class BusMetrics:
+    """
+    Timing of the requests on one serial bus, shared by all inverters on it.
+
+    Histograms and counters cover one summary interval. The summary is rolled by whichever inverter
+    asks for it first once the interval has passed, all inverters get the same summary.
+    """
+
+    def __init__(self):
+        self.rtt = Histogram()
+        self.silent_wait = Histogram()
+        self.idle_gap = Histogram()
+        self.dropped = 0
+        self.summary = dict()
+        self._counted = dict()
+        self._lock = Lock()
+        self._rolled = monotonic()
+
+    def record(self, rtt: float, silent_wait: float, idle_gap: Union[float, None]) -> None:
+        # Durations in seconds, the idle gap is None if there was no frame before.
+        # Several inverters share the bus, roll() may reset the histograms meanwhile
+        with self._lock:
+            self.rtt.add(rtt * 1000)
+            self.silent_wait.add(silent_wait * 1000)
+            if idle_gap is not None:
+                self.idle_gap.add(idle_gap * 1000)
+
+    def record_dropped(self) -> None:
+        with self._lock:
+            self.dropped += 1
+
+    def roll(self, client, now: float) -> Dict[str, Union[int, float]]:
+        """
+        :return: the dbus paths and values of the last completed interval
+        """
+        with self._lock:
+            if now - self._rolled >= utils.DEBUG_SUMMARY_INTERVAL:
+                self._rolled = now
+                self.summary = {
+                    "/Debug/Bus/Rtt/Last": round(self.rtt.last, 1),
+                    "/Debug/Bus/Rtt/Mean": round(self.rtt.mean(), 1),
+                    "/Debug/Bus/Rtt/P95": round(self.rtt.percentile(0.95), 1),
+                    "/Debug/Bus/SilentWait/Mean": round(self.silent_wait.mean(), 2),
+                    "/Debug/Bus/SilentWait/P95": round(self.silent_wait.percentile(0.95), 2),
+                    "/Debug/Bus/IdleGap/Min": round(self.idle_gap.min, 2),
+                    "/Debug/Bus/IdleGap/P50": round(self.idle_gap.percentile(0.5), 2),
+                    "/Debug/Bus/Requests": self.rtt.count,
+                    "/Debug/Bus/Dropped": self.dropped,
+                }
+                for path, attribute in CLIENT_COUNTERS:
+                    count = getattr(client, attribute, 0)
+                    self.summary[path] = count - self._counted.get(attribute, 0)
+                    self._counted[attribute] = count
+                self.dropped = 0
+                self.rtt.reset()
+                self.silent_wait.reset()
+                self.idle_gap.reset()
+            return self.summary
+
+
+class PollMetrics:
+    """
+    Duration of Inverter.refresh_data() per poll, summarized every DEBUG_SUMMARY_INTERVAL seconds
+    together with the metrics of the inverter's bus.
+    """
+
+    def __init__(self, name, bus_metrics: Union[BusMetrics, None] = None, client=None):
+        self.name = name
+        self.duration = Histogram()
+        self.bus_metrics = bus_metrics
+        self.client = client
+        self._summarized = monotonic()
+
+    def record(self, duration: float) -> None:
+        self.duration.add(duration * 1000)
+
+    def summarize(self, now: float) -> Union[Dict[str, Union[int, float]], None]:
+        """
+        :return: the dbus paths and values once per summary interval, None in between
+        """
+        if now - self._summarized < utils.DEBUG_SUMMARY_INTERVAL:
+            return None
+        self._summarized = now
+
+        summary = {
+            "/Debug/PollDuration/Last": round(self.duration.last, 1),
+            "/Debug/PollDuration/Mean": round(self.duration.mean(), 1),
+            "/Debug/PollDuration/P95": round(self.duration.percentile(0.95), 1),
+            "/Debug/Polls": self.duration.count,
+        }
+        self.duration.reset()
+        if self.bus_metrics is not None:
+            summary.update(self.bus_metrics.roll(self.client, now))
+
+        values = ", ".join("%s=%s" % (path[len("/Debug/"):], value) for path, value in summary.items())
+        logger.info("%s timing (ms) over %ss: %s" % (self.name, utils.DEBUG_SUMMARY_INTERVAL, values))
+        return summary
+
+
+# Paths published by PollMetrics.summarize(), added to dbus before the first summary
+DEBUG_PATHS = (
+    "/Debug/PollDuration/Last",
+    "/Debug/PollDuration/Mean",
+    "/Debug/PollDuration/P95",
+    "/Debug/Polls",
+    "/Debug/Bus/Rtt/Last",
+    "/Debug/Bus/Rtt/Mean",
+    "/Debug/Bus/Rtt/P95",
+    "/Debug/Bus/SilentWait/Mean",
+    "/Debug/Bus/SilentWait/P95",
+    "/Debug/Bus/IdleGap/Min",
+    "/Debug/Bus/IdleGap/P50",
+    "/Debug/Bus/Requests",
+    "/Debug/Bus/Retries",
+    "/Debug/Bus/Timeouts",
+    "/Debug/Bus/CrcErrors",
+    "/Debug/Bus/Resyncs",
+    "/Debug/Bus/Dropped",
+)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import traceback
+from threading import Event, Lock, Thread
+from time import monotonic
+
+from gi.repository import GLib
+
+from utils import logger
+
+
+class Poller(Thread):
+    """
+    Single long-lived worker which polls the inverter on a deadline based schedule.
+
+    A poll never overlaps with the next one. If a poll takes longer than poll_interval the missed
+    ticks are skipped instead of queued. Finished snapshots are handed to the GLib main loop, where
+    only the most recent one is published if the main loop falls behind.
+    """
+
+    def __init__(self, helper, loop):
+        super(Poller, self).__init__(name="poller", daemon=True)
+        self.helper = helper
+        self.loop = loop
+        self._stop_event = Event()
+        self._lock = Lock()
+        self._pending = None
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        deadline = monotonic()
+        while not self._stop_event.is_set():
+            try:
+                snapshot = self.helper.refresh_inverter()
+            except Exception:
+                traceback.print_exc()
+                snapshot = None
+
+            if snapshot is None:
+                GLib.idle_add(self.loop.quit)
+                return
+
+            self.hand_over(snapshot)
+
+            interval = self.helper.inverter.poll_interval / 1000
+            deadline += interval
+            now = monotonic()
+            if now > deadline:
+                missed = int((now - deadline) / interval) + 1
+                deadline += missed * interval
+                logger.debug("Poll took too long, skipping %d tick(s)" % missed)
+            self._stop_event.wait(deadline - now)
+
+    def hand_over(self, snapshot):
+        with self._lock:
+            scheduled = self._pending is not None
+            self._pending = snapshot
+        if not scheduled:
+            GLib.idle_add(self._publish)
+
+    def _publish(self):
+        # Runs in the GLib main loop
+        with self._lock:
+            snapshot = self._pending
+            self._pending = None
+        self.helper.publish_dbus(snapshot)
+        return False
+
+
+class ControlWriter(Thread):
+    """
+    Worker which writes control values like the power limit as soon as they change on dbus,
+    without waiting for the next poll. Its bus requests have control priority, so they are sent before
+    any pending telemetry reads. Changes arriving while a write is in progress are coalesced.
+    """
+
+    def __init__(self, inverter):
+        super(ControlWriter, self).__init__(name="control", daemon=True)
+        self.inverter = inverter
+        self._changed = Event()
+        self._changed_at = None
+
+    def submit(self):
+        if self._changed_at is None:
+            self._changed_at = monotonic()
+        self._changed.set()
+
+    def run(self):
+        while True:
+            self._changed.wait()
+            self._changed.clear()
+            changed_at, self._changed_at = self._changed_at, None
+            try:
+                success = self.inverter.apply_power_limit(urgent=True)
+            except Exception:
+                traceback.print_exc()
+                continue
+
+            latency = (monotonic() - changed_at) * 1000 if changed_at is not None else 0
+            if success:
+                logger.debug("Power limit applied in %d ms" % latency)
+            else:
+                logger.warning("Power limit could not be applied, retrying with the next poll")
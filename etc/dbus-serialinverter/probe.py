@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Dict, List, Union
+
+from inverter import Inverter
+from probecache import get_cached_probe, save_probe
+from utils import logger
+
+# Bits per character on the wire: start + 8 data + parity/stop + stop
+BITS_PER_CHAR = 11
+# Bytes of a read request: slave, function code, address, count, CRC
+REQUEST_BYTES = 8
+# Max. time a slave takes to start its reply, in seconds
+PROBE_TURNAROUND = 0.2
+
+
+class Candidate:
+    """
+    One combination of driver, baudrate and slave id which may answer at a port.
+    """
+
+    def __init__(self, port, inverter_class, baudrate, slave):
+        self.port = port
+        self.inverter_class = inverter_class
+        self.baudrate = baudrate
+        self.slave = slave
+
+    @property
+    def name(self) -> str:
+        return "%s@%s/%s" % (self.inverter_class.__name__, self.baudrate, self.slave)
+
+    def key(self):
+        return self.inverter_class, self.baudrate, self.slave
+
+
+def probe_timeout(baudrate, reply_registers=4) -> Union[float, None]:
+    """
+    Timeout for a probe request: the time on the wire of request and a reply with up to
+    reply_registers registers plus the slave turnaround.
+
+    :return: the timeout in seconds, None if the baudrate is unknown
+    """
+    if not baudrate:
+        return None
+    reply_bytes = 5 + 2 * reply_registers
+    return round((REQUEST_BYTES + reply_bytes) * BITS_PER_CHAR / baudrate + PROBE_TURNAROUND, 3)
+
+
+def order_candidates(port, inverter_types: List[dict]) -> List[Candidate]:
+    """
+    Build the candidates for a port from the supported inverter types. The combination found on
+    the last start is tried first if its type and slave id are still configured, the others follow
+    in the order of inverter_types.
+    """
+    candidates = [
+        Candidate(port, inverter_type["inverter"], inverter_type["baudrate"], inverter_type.get("slave"))
+        for inverter_type in inverter_types
+    ]
+
+    cached = get_cached_probe(port)
+    if cached is not None:
+        for candidate in candidates:
+            if candidate.inverter_class.__name__ != cached["inverter"]:
+                continue
+            # The slave id comes from the config, an entry from before ADDRESS was changed is stale
+            if cached["slave"] != candidate.slave:
+                logger.info("Ignoring probe cache entry for %s, slave %s is not configured" % (port, cached["slave"]))
+                break
+            first = Candidate(port, candidate.inverter_class, cached["baudrate"], cached["slave"])
+            candidates = [first] + [c for c in candidates if c.key() != first.key()]
+            break
+
+    return candidates
+
+
+def probe_port(candidates: List[Candidate]) -> Union[Inverter, None]:
+    """
+    Test the candidates of one port after each other with shortened timeouts.
+    The remaining candidates are skipped as soon as one answers.
+    """
+    for candidate in candidates:
+        logger.info("Testing " + candidate.name)
+        start = monotonic()
+        inverter: Inverter = candidate.inverter_class(
+            port=candidate.port, baudrate=candidate.baudrate, slave=candidate.slave
+        )
+        inverter.set_timeout(probe_timeout(candidate.baudrate))
+        success = inverter.test_connection()
+        latency = (monotonic() - start) * 1000
+
+        if success:
+            logger.info("Probe %s at %s succeeded in %d ms" % (candidate.name, candidate.port, latency))
+            inverter.set_timeout(None)
+            save_probe(candidate.port, candidate.inverter_class.__name__, candidate.baudrate, candidate.slave)
+            return inverter
+
+        logger.info("Probe %s at %s failed after %d ms" % (candidate.name, candidate.port, latency))
+        inverter.close()
+
+    return None
+
+
+def probe_ports(candidates_by_port: Dict[str, List[Candidate]]) -> Dict[str, Union[Inverter, None]]:
+    """
+    Probe several ports concurrently, the candidates of each port are tested with probe_port().
+
+    :return: the inverter found per port, None for ports without one
+    """
+    if len(candidates_by_port) == 1:
+        port, candidates = next(iter(candidates_by_port.items()))
+        return {port: probe_port(candidates)}
+
+    with ThreadPoolExecutor(max_workers=len(candidates_by_port), thread_name_prefix="probe") as executor:
+        futures = {port: executor.submit(probe_port, candidates) for port, candidates in candidates_by_port.items()}
+        return {port: future.result() for port, future in futures.items()}
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+from threading import Lock
+
+from utils import logger
+import utils
+
+# Inverter type, baudrate and slave found per port, stored next to config.ini
+probe_cache_path = utils.path.joinpath("probecache.json").absolute().__str__()
+# The ports are probed concurrently, their results are written one after the other
+probe_cache_lock = Lock()
+
+
+def load_probe_cache() -> dict:
+    try:
+        with open(probe_cache_path) as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else dict()
+    except FileNotFoundError:
+        return dict()
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable probe cache %s: %s" % (probe_cache_path, e))
+        return dict()
+
+
+def get_cached_probe(port) -> dict:
+    """
+    :return: the inverter found on the last start at port, e.g. {"inverter": "Solis", "baudrate": 9600, "slave": 1},
+        or None if there is none or the entry is invalid
+    """
+    cached = load_probe_cache().get(port)
+    if cached is None:
+        return None
+    if (
+        not isinstance(cached, dict)
+        or not isinstance(cached.get("inverter"), str)
+        or not isinstance(cached.get("baudrate"), int)
+        or not isinstance(cached.get("slave"), int)
+    ):
+        logger.warning("Ignoring invalid probe cache entry for %s: %s" % (port, cached))
+        return None
+    return cached
+
+
+def save_probe(port, inverter_name, baudrate, slave) -> None:
+    probe = {"inverter": inverter_name, "baudrate": baudrate, "slave": slave}
+    with probe_cache_lock:
+        cache = load_probe_cache()
+        if cache.get(port) == probe:
+            return
+
+        cache[port] = probe
+        tmp_path = None
+        try:
+            # Write to a temporary file first so a power loss can't leave a truncated cache behind
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(probe_cache_path), prefix="probecache.", suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(cache, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, probe_cache_path)
+        except OSError as e:
+            logger.warning("Could not write probe cache %s: %s" % (probe_cache_path, e))
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from typing import Dict, Tuple
+
+import utils
+
+
+def parse_deadband(value: str) -> Tuple[float, bool]:
+    """
+    Parse a deadband from config, either an absolute value ("0.1") or a percentage ("2%").
+
+    :return: the deadband and whether it is relative to the last published value
+    """
+    value = value.strip()
+    if value.endswith("%"):
+        return float(value[:-1]) / 100, True
+    return float(value), False
+
+
+class ChangeFilter:
+    """
+    Remembers the last published value of every dbus path and only lets values through
+    which moved beyond the deadband of their path. Paths without a deadband are published
+    on any change.
+    """
+
+    def __init__(self, deadbands: Dict[str, Tuple[float, bool]]):
+        # path suffix: (deadband, relative)
+        self.deadbands = deadbands
+        self.published = dict()
+        self._path_deadbands = dict()
+
+    def deadband(self, path) -> Tuple[float, bool]:
+        if path not in self._path_deadbands:
+            self._path_deadbands[path] = next(
+                (deadband for suffix, deadband in self.deadbands.items() if path.endswith(suffix)),
+                (0, False),
+            )
+        return self._path_deadbands[path]
+
+    def changes(self, values: Dict) -> Dict:
+        """
+        :return: the values which need to be published, they are remembered as published
+        """
+        changed = dict()
+        for path, value in values.items():
+            if path in self.published and not self.exceeds(path, self.published[path], value):
+                continue
+            changed[path] = value
+            self.published[path] = value
+        return changed
+
+    def exceeds(self, path, old, new) -> bool:
+        if old is None or new is None or isinstance(new, str):
+            return old != new
+
+        deadband, relative = self.deadband(path)
+        if relative:
+            deadband = abs(old) * deadband
+        if deadband == 0:
+            return new != old
+        return abs(new - old) > deadband
+
+    def reset(self) -> None:
+        # Publish everything on the next call
+        self.published.clear()
+
+
+def get_change_filter() -> ChangeFilter:
+    return ChangeFilter(
+        {
+            "/Voltage": parse_deadband(utils.DEADBAND_VOLTAGE),
+            "/Current": parse_deadband(utils.DEADBAND_CURRENT),
+            "/Power": parse_deadband(utils.DEADBAND_POWER),
+            "/Energy/Forward": parse_deadband(utils.DEADBAND_ENERGY),
+        }
+    )
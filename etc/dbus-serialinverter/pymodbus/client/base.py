@@ -63,8 +63,15 @@ class ModbusBaseClient(ModbusClientMixin):
     """
 
     state = ModbusTransactionState.IDLE
-    last_frame_end = 0
+    last_frame_end = 0  # time.monotonic_ns() at the end of the last frame
     silent_interval = 0
+    # Diagnostic counters
+    retry_count = 0
+    timeout_count = 0
+    crc_error_count = 0
+    resync_count = 0
+    silent_wait = 0  # time the last send waited for the bus to be idle
+    idle_gap = None  # time between the end of the last frame and the last send
 
     @dataclass
     class _params:  # pylint: disable=too-many-instance-attributes
@@ -167,10 +174,12 @@ class ModbusBaseClient(ModbusClientMixin):
 
         Applications can call message functions without checking idle_time(),
         this is done automatically.
+
+        :returns: The time.monotonic_ns() the bus is idle from
         """
         if self.last_frame_end is None or self.silent_interval is None:
             return 0
-        return self.last_frame_end + self.silent_interval
+        return self.last_frame_end + int(self.silent_interval * 1e9)
 
     def reset_delay(self) -> None:
         """Reset wait time before next reconnect to minimal period (call **sync**)."""
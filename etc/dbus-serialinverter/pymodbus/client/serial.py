@@ -1,5 +1,6 @@
 """Modbus client async serial communication."""
 import asyncio
+import select
 import time
 from functools import partial
 
@@ -175,6 +176,9 @@ class ModbusSerialClient(ModbusBaseClient):
     state = ModbusTransactionState.IDLE
     inter_char_timeout = 0
     silent_interval = 0
+    # Added to the 3.5 char gap ending a frame of unknown length: USB serial
+    # adapters hand the received bytes over in chunks, e.g. every 16 ms (FTDI)
+    recv_latency = 0.016
 
     def __init__(
         self,
@@ -196,6 +200,7 @@ class ModbusSerialClient(ModbusBaseClient):
         self.params.stopbits = stopbits
         self.params.handle_local_echo = handle_local_echo
         self.socket = None
+        self._poll = None
 
         self.last_frame_end = None
         if isinstance(self.framer, ModbusRtuFramer):
@@ -229,6 +234,7 @@ class ModbusSerialClient(ModbusBaseClient):
                 if self.params.strict:
                     self.socket.interCharTimeout = self.inter_char_timeout
                 self.last_frame_end = None
+            self._poll = self._create_poll()
         except serial.SerialException as msg:
             Log.error("{}", msg)
             self.close()
@@ -239,6 +245,23 @@ class ModbusSerialClient(ModbusBaseClient):
         if self.socket:
             self.socket.close()
         self.socket = None
+        self._poll = None
+
+    def _create_poll(self):
+        """Return a poll object for the port, None if it has no file descriptor.
+
+        Ports without one, e.g. URLs like loop://, are read by polling
+        in_waiting instead.
+        """
+        if not hasattr(select, "poll"):
+            return None
+        try:
+            fileno = self.socket.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+        poll = select.poll()
+        poll.register(fileno, select.POLLIN)
+        return poll
 
     def _in_waiting(self):
         """Return _in_waiting."""
@@ -301,6 +324,35 @@ class ModbusSerialClient(ModbusBaseClient):
             time.sleep(0.01)
         return size
 
+    def _recv_poll(self, size):
+        """Read size bytes, or a frame of unknown size if None, waiting on the descriptor.
+
+        Returns as soon as size bytes arrived. A frame also ends when the line
+        is silent for 3.5 chars (plus recv_latency) after the first byte, e.g. a
+        short exception response, when the timeout expires, or when the port
+        hangs up or fails, with the bytes read so far.
+        """
+        data = b""
+        timeout = self.params.timeout or None
+        deadline = time.monotonic() + timeout if timeout else None
+        gap = self.silent_interval + self.recv_latency
+        while size is None or len(data) < size:
+            wait = None if deadline is None else deadline - time.monotonic()
+            if data:
+                wait = gap if wait is None else min(wait, gap)
+            if wait is not None and wait <= 0:
+                break
+            events = self._poll.poll(None if wait is None else wait * 1000)
+            if not events:
+                break
+            if events[0][1] & (select.POLLHUP | select.POLLERR | select.POLLNVAL):
+                # The port is gone, e.g. the USB adapter was unplugged, reading would spin until the timeout
+                Log.warning("Serial port {} hung up or failed", self.params.port)
+                break
+            available = max(1, self._in_waiting())
+            data += self.socket.read(available if size is None else min(available, size - len(data)))
+        return data
+
     def recv(self, size):
         """Read data from the underlying descriptor."""
         super().recv(size)
@@ -308,6 +360,8 @@ class ModbusSerialClient(ModbusBaseClient):
             raise ConnectionException(
                 self.__str__()  # pylint: disable=unnecessary-dunder-call
             )
+        if self._poll is not None:
+            return self._recv_poll(size)
         if size is None:
             size = self._wait_for_data()
         elif size > self._in_waiting():
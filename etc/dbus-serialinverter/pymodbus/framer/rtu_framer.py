@@ -9,11 +9,15 @@ from pymodbus.exceptions import (
 )
 from pymodbus.framer import BYTE_ORDER, FRAME_HEADER, ModbusFramer
 from pymodbus.logging import Log
+from pymodbus.pdu import ExceptionResponse
 from pymodbus.utilities import ModbusTransactionState, checkCRC, computeCRC
 
 
 RTU_FRAME_HEADER = BYTE_ORDER + FRAME_HEADER
 
+# Consumed bytes kept in front of the receive buffer before it is compacted
+RTU_COMPACT_THRESHOLD = 1024
+
 
 # --------------------------------------------------------------------------- #
 # Modbus RTU Message
@@ -24,6 +28,15 @@ class ModbusRtuFramer(ModbusFramer):
         [ Start Wait ] [Address ][ Function Code] [ Data ][ CRC ][  End Wait  ]
           3.5 chars     1b         1b               Nb      2b      3.5 chars
 
+    Received data is appended to a reusable bytearray. Frames are consumed by
+    moving a read cursor, the buffer is only compacted once the cursor passes
+    RTU_COMPACT_THRESHOLD (or cleared once everything is consumed), and frames
+    are checked and returned as memoryview slices of the buffer.
+
+    A frame failing its CRC check doesn't discard the buffer: the framer slides
+    forward one byte at a time and resumes at the first plausible frame with a
+    valid CRC, e.g. a response behind a noise byte on a long RS485 line.
+
     Wait refers to the amount of time required to transmit at least x many
     characters.  In this case it is 3.5 characters.  Also, if we receive a
     wait of 1.5 characters at any point, we must trigger an error message.
@@ -58,7 +71,9 @@ class ModbusRtuFramer(ModbusFramer):
 
         :param decoder: The decoder factory implementation to use
         """
-        self._buffer = b""
+        self._buffer = bytearray()
+        self._start = 0  # read cursor, start of the current frame in _buffer
+        self._resynced = False  # the current frame was found by resyncFrame()
         self._header = {"uid": 0x00, "len": 0, "crc": b"\x00\x00"}
         self._hsize = 0x01
         self._end = b"\x0d\x0a"
@@ -69,6 +84,24 @@ class ModbusRtuFramer(ModbusFramer):
     # ----------------------------------------------------------------------- #
     # Private Helper Functions
     # ----------------------------------------------------------------------- #
+    def _view(self):
+        """Return the unconsumed data as memoryview.
+
+        The view has to be dropped before the buffer is changed, a bytearray
+        can't be resized while views of it exist.
+        """
+        return memoryview(self._buffer)[self._start :]
+
+    def _consume(self, size):
+        """Move the read cursor over size bytes and compact the buffer if due."""
+        self._start = min(self._start + size, len(self._buffer))
+        if self._start == len(self._buffer):
+            self._buffer.clear()
+            self._start = 0
+        elif self._start > RTU_COMPACT_THRESHOLD:
+            del self._buffer[: self._start]
+            self._start = 0
+
     def decode_data(self, data):
         """Decode data."""
         if len(data) > self._hsize:
@@ -88,7 +121,7 @@ class ModbusRtuFramer(ModbusFramer):
         try:
             self.populateHeader()
             frame_size = self._header["len"]
-            data = self._buffer[: frame_size - 2]
+            data = self._view()[: frame_size - 2]
             crc = self._header["crc"]
             crc_val = (int(crc[0]) << 8) + int(crc[1])
             return checkCRC(data, crc_val)
@@ -102,7 +135,8 @@ class ModbusRtuFramer(ModbusFramer):
         it or determined that it contains an error. It also has to reset the
         current frame header handle
         """
-        self._buffer = self._buffer[self._header["len"] :]
+        self._consume(self._header["len"])
+        self._resynced = False
         Log.debug("Frame advanced, resetting header!!")
         self._header = {"uid": 0x00, "len": 0, "crc": b"\x00\x00"}
 
@@ -116,10 +150,74 @@ class ModbusRtuFramer(ModbusFramer):
         check for millisecond delays).
         """
         Log.debug(
-            "Resetting frame - Current Frame in buffer - {}", self._buffer, ":hex"
+            "Resetting frame - Current Frame in buffer - {}", self._view(), ":hex"
         )
-        self._buffer = b""
+        self._buffer.clear()
+        self._start = 0
+        self._resynced = False
+        self._header = {"uid": 0x00, "len": 0, "crc": b"\x00\x00"}
+
+    def _find_frame(self, units, single):
+        """Find the offset of the next frame in the unconsumed data.
+
+        Every offset after the current frame start is tried: the unit id has to
+        be accepted and the function code known to the decoder (or the exception
+        response of a known one), then the CRC of the frame has to match.
+
+        :returns: (offset, complete), offset None if there is no frame.
+            A candidate which isn't complete yet ends the search.
+        """
+        data = self._view()
+        for offset in range(1, len(data) - self._hsize):
+            uid = data[offset]
+            if not (single or 0 in units or 0xFF in units or uid in units):
+                continue
+            if self.decoder.lookupPduClass(data[offset + 1] & 0x7F) is ExceptionResponse:
+                continue
+            try:
+                size = self.get_expected_response_length(data[offset:])
+            except IndexError:
+                return offset, False
+            if size < self._min_frame_size:
+                continue
+            if offset + size > len(data):
+                return offset, False
+            crc = (data[offset + size - 2] << 8) + data[offset + size - 1]
+            if checkCRC(data[offset : offset + size - 2], crc):
+                return offset, True
+        return None, False
+
+    def resyncFrame(self, units, single=False):  # pylint: disable=invalid-name
+        """Skip to the next frame after a failed frame check.
+
+        The data in front of the frame found is dropped. If the frame is not
+        complete yet it is kept to wait for the rest, see getMissingBytes().
+
+        :param units: The accepted unit ids
+        :param single: Accept any unit id
+        :returns: True if the data was resynchronised, False if there is no frame
+        """
+        offset, complete = self._find_frame(units, single)
+        if offset is None:
+            return False
+        Log.debug("Resynchronised after {} bytes, frame complete: {}", offset, complete)
+        self._consume(offset)
         self._header = {"uid": 0x00, "len": 0, "crc": b"\x00\x00"}
+        self._resynced = True
+        if self.client is not None:
+            self.client.resync_count += 1
+        return True
+
+    def getMissingBytes(self):  # pylint: disable=invalid-name
+        """Return the number of bytes a resynchronised frame is still missing.
+
+        A response behind noise is read with the expected length, so its last
+        bytes are still waiting to be read when the frame is found.
+        """
+        if not self._resynced:
+            return 0
+        available = len(self._buffer) - self._start
+        return max(0, self._header.get("len", 0) - available)
 
     def isFrameReady(self):
         """Check if we should continue decode logic.
@@ -130,7 +228,8 @@ class ModbusRtuFramer(ModbusFramer):
         :returns: True if ready, False otherwise
         """
         size = self._header.get("len", 0)
-        if not size and len(self._buffer) > self._hsize:
+        available = len(self._buffer) - self._start
+        if not size and available > self._hsize:
             try:
                 # Frame is ready only if populateHeader() successfully
                 # populates crc field which finishes RTU frame otherwise,
@@ -139,7 +238,7 @@ class ModbusRtuFramer(ModbusFramer):
             except IndexError:
                 return False
 
-        return len(self._buffer) >= size if size > 0 else False
+        return available >= size if size > 0 else False
 
     def populateHeader(self, data=None):  # pylint: disable=invalid-name
         """Try to set the headers `uid`, `len` and `crc`.
@@ -150,7 +249,7 @@ class ModbusRtuFramer(ModbusFramer):
         Beware that this method will raise an IndexError if
         `self._buffer` is not yet long enough.
         """
-        data = data if data is not None else self._buffer
+        data = data if data is not None else self._view()
         self._header["uid"] = int(data[0])
         size = self.get_expected_response_length(data)
         self._header["len"] = size
@@ -158,7 +257,7 @@ class ModbusRtuFramer(ModbusFramer):
         if len(data) < size:
             # crc yet not available
             raise IndexError
-        self._header["crc"] = data[size - 2 : size]
+        self._header["crc"] = bytes(data[size - 2 : size])
         return size
 
     def addToFrame(self, message):
@@ -171,12 +270,12 @@ class ModbusRtuFramer(ModbusFramer):
     def getFrame(self):
         """Get the next frame from the buffer.
 
-        :returns: The frame data or ""
+        :returns: The frame data as memoryview, valid until the buffer changes, or ""
         """
         start = self._hsize
         end = self._header["len"] - 2
-        buffer = self._buffer[start:end]
         if end > 0:
+            buffer = self._view()[start:end]
             Log.debug("Getting Frame - {}", buffer, ":hex")
             return buffer
         return b""
@@ -230,9 +329,12 @@ class ModbusRtuFramer(ModbusFramer):
                         self.resetFrame()
                         break
                 else:
-                    Log.debug("Frame check failed, ignoring!!")
-                    self.resetFrame()
-                    break
+                    if self.client is not None:
+                        self.client.crc_error_count += 1
+                    if not self.resyncFrame(unit, single):
+                        Log.debug("Frame check failed, ignoring!!")
+                        self.resetFrame()
+                        break
             else:
                 Log.debug("Frame - [{}] not ready", data)
                 break
@@ -251,40 +353,45 @@ class ModbusRtuFramer(ModbusFramer):
         message.transaction_id = message.unit_id
         return packet
 
+    def _wait_for_idle_bus(self):
+        """Sleep for the rest of the 3.5 char gap after the last frame, if any."""
+        if self.client.last_frame_end:
+            remaining = self.client.idle_time() - time.monotonic_ns()
+            if remaining > 0:
+                Log.debug("Waiting for 3.5 char before next send - {} ms", remaining / 1e6)
+                time.sleep(remaining / 1e9)
+        else:
+            # Recovering from last error ??
+            time.sleep(self.client.silent_interval)
+
     def sendPacket(self, message):
         """Send packets on the bus with 3.5char delay between frames.
 
+        All timing is on the monotonic clock (time.monotonic_ns), frames are
+        sent as soon as the line was silent for 3.5 chars. The time waited is
+        kept in client.silent_wait, the measured gap between the end of the
+        last frame and this one in client.idle_gap (both in seconds).
+
         :param message: Message to be sent over the bus
         :return:
         """
-        start = time.time()
-        timeout = start + self.client.params.timeout
+        start = time.monotonic_ns()
+        timeout = start + int(self.client.params.timeout * 1e9)
         while self.client.state != ModbusTransactionState.IDLE:
             if self.client.state == ModbusTransactionState.TRANSACTION_COMPLETE:
-                timestamp = round(time.time(), 6)
                 Log.debug(
                     "Changing state to IDLE - Last Frame End - {} Current Time stamp - {}",
                     self.client.last_frame_end,
-                    timestamp,
+                    start,
                 )
-                if self.client.last_frame_end:
-                    idle_time = self.client.idle_time()
-                    if round(timestamp - idle_time, 6) <= self.client.silent_interval:
-                        Log.debug(
-                            "Waiting for 3.5 char before next send - {} ms",
-                            self.client.silent_interval * 1000,
-                        )
-                        time.sleep(self.client.silent_interval)
-                else:
-                    # Recovering from last error ??
-                    time.sleep(self.client.silent_interval)
+                self._wait_for_idle_bus()
                 self.client.state = ModbusTransactionState.IDLE
             elif self.client.state == ModbusTransactionState.RETRYING:
-                # Simple lets settle down!!!
-                # To check for higher baudrates
-                time.sleep(self.client.params.timeout)
+                # The failed attempt already waited for the response until its
+                # timeout, a late response is picked up by send()
+                self._wait_for_idle_bus()
                 break
-            elif time.time() > timeout:
+            elif time.monotonic_ns() > timeout:
                 Log.debug(
                     "Spent more time than the read time out, "
                     "resetting the transaction to IDLE"
@@ -293,8 +400,15 @@ class ModbusRtuFramer(ModbusFramer):
             else:
                 Log.debug("Sleeping")
                 time.sleep(self.client.silent_interval)
+        sent = time.monotonic_ns()
+        self.client.silent_wait = (sent - start) / 1e9
+        self.client.idle_gap = (
+            (sent - self.client.last_frame_end) / 1e9
+            if self.client.last_frame_end
+            else None
+        )
         size = self.client.send(message)
-        self.client.last_frame_end = round(time.time(), 6)
+        self.client.last_frame_end = time.monotonic_ns()
         return size
 
     def recvPacket(self, size):
@@ -304,12 +418,14 @@ class ModbusRtuFramer(ModbusFramer):
         :return:
         """
         result = self.client.recv(size)
-        self.client.last_frame_end = round(time.time(), 6)
+        self.client.last_frame_end = time.monotonic_ns()
         return result
 
     def _process(self, callback, error=False):
         """Process incoming packets irrespective error condition."""
-        data = self.getRawFrame() if error else self.getFrame()
+        # The decoder gets its own copy of the PDU, decoded messages may keep
+        # slices of it which must not pin (or see changes of) the receive buffer
+        data = bytes(self.getRawFrame() if error else self.getFrame())
         if (result := self.decoder.decode(data)) is None:
             raise ModbusIOException("Unable to decode request")
         if error and result.function_code < 0x80:
@@ -319,9 +435,10 @@ class ModbusRtuFramer(ModbusFramer):
         callback(result)  # defer or push to a thread?
 
     def getRawFrame(self):  # pylint: disable=invalid-name
-        """Return the complete buffer."""
-        Log.debug("Getting Raw Frame - {}", self._buffer, ":hex")
-        return self._buffer
+        """Return the complete unconsumed buffer as memoryview."""
+        buffer = self._view()
+        Log.debug("Getting Raw Frame - {}", buffer, ":hex")
+        return buffer
 
     def get_expected_response_length(self, data):
         """Get the expected response length.
@@ -208,6 +208,17 @@ class ModbusTransactionManager:
                     self.client.framer.processIncomingPacket(
                         response, addTransaction, request.unit_id
                     )
+                    if (
+                        not self.transactions
+                        and isinstance(self.client.framer, ModbusRtuFramer)
+                        and (missing := self.client.framer.getMissingBytes())
+                    ):
+                        # A response found behind noise, read its rest instead of retrying
+                        self.client.framer.processIncomingPacket(
+                            self.client.framer.recvPacket(missing),
+                            addTransaction,
+                            request.unit_id,
+                        )
                     if not (response := self.getTransaction(request.transaction_id)):
                         if len(self.transactions):
                             response = self.getTransaction(tid=0)
@@ -241,6 +252,7 @@ class ModbusTransactionManager:
     def _retry_transaction(self, retries, reason, packet, response_length, full=False):
         """Retry transaction."""
         Log.debug("Retry on {} response - {}", reason, retries)
+        self.client.retry_count += 1
         Log.debug('Changing transaction state from "WAITING_FOR_REPLY" to "RETRYING"')
         self.client.state = ModbusTransactionState.RETRYING
         if self.backoff:
@@ -340,6 +352,8 @@ class ModbusTransactionManager:
 
             read_min = self.client.framer.recvPacket(min_size)
             if len(read_min) != min_size:
+                # The read deadline expired, count it before giving up on the frame
+                self.client.timeout_count += 1
                 msg_start = "Incomplete message" if read_min else "No response"
                 raise InvalidMessageReceivedException(
                     f"{msg_start} received, expected at least {min_size} bytes "
@@ -392,6 +406,7 @@ class ModbusTransactionManager:
         result = read_min + result
         actual = len(result)
         if total is not None and actual != total:
+            self.client.timeout_count += 1
             msg_start = "Incomplete message" if actual else "No response"
             Log.debug(
                 "{} received, Expected {} bytes Received {} bytes !!!!",
@@ -402,6 +417,7 @@ class ModbusTransactionManager:
         elif not actual:
             # If actual == 0 and total is not None then the above
             # should be triggered, so total must be None here
+            self.client.timeout_count += 1
             Log.debug("No response received to unbounded read !!!!")
         if self.client.state != ModbusTransactionState.PROCESSING_REPLY:
             Log.debug(
@@ -5,6 +5,7 @@ data computing checksums, and decode checksums.
 """
 # pylint: disable=missing-type-doc
 import struct
+from array import array
 
 
 class ModbusTransactionState:  # pylint: disable=too-few-public-methods
@@ -178,6 +179,43 @@ def __generate_crc16_table():
 __crc16_table = __generate_crc16_table()
 
 
+def _generate_crc16_word_table(table):
+    """Generate a crc16 lookup table for two bytes at once.
+
+    ``crc = table[crc ^ word]`` updates the crc by both bytes of a little
+    endian word with a single lookup, which is a lot cheaper in python than
+    two byte steps. The table takes 128 KiB.
+    """
+    second = [(table[byte] >> 8) ^ table[table[byte] & 0xFF] for byte in range(256)]
+    return array("H", [second[word & 0xFF] ^ table[word >> 8] for word in range(65536)])
+
+
+_crc16_word_table = _generate_crc16_word_table(__crc16_table)
+
+
+# Word unpackers for up to a maximum RTU frame (256 bytes)
+_crc16_word_unpackers = [struct.Struct("<%dH" % words).unpack_from for words in range(129)]
+
+
+def _crc16_update(crc, data):
+    """Update a (not swapped) crc16 by data, one word per step."""
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(int(data_byte) for data_byte in data)
+    size = len(data)
+    offset = size & 1
+    if offset:
+        crc = (crc >> 8) ^ __crc16_table[(crc ^ data[0]) & 0xFF]
+    words = size >> 1
+    if words < 129:
+        words = _crc16_word_unpackers[words](data, offset)
+    else:
+        words = struct.unpack_from("<%dH" % words, data, offset)
+    table = _crc16_word_table
+    for word in words:
+        crc = table[crc ^ word]
+    return crc
+
+
 def computeCRC(data):  # pylint: disable=invalid-name
     """Compute a crc16 on the passed in string.
 
@@ -190,10 +228,7 @@ def computeCRC(data):  # pylint: disable=invalid-name
     :param data: The data to create a crc16 of
     :returns: The calculated CRC
     """
-    crc = 0xFFFF
-    for data_byte in data:
-        idx = __crc16_table[(crc ^ int(data_byte)) & 0xFF]
-        crc = ((crc >> 8) & 0xFF) ^ idx
+    crc = _crc16_update(0xFFFF, data)
     swapped = ((crc << 8) & 0xFF00) | ((crc >> 8) & 0x00FF)
     return swapped
 
@@ -208,6 +243,57 @@ def checkCRC(data, check):  # pylint: disable=invalid-name
     return computeCRC(data) == check
 
 
+def checkFrameCRCs(frames):  # pylint: disable=invalid-name
+    """Check the CRC of many complete RTU frames, e.g. from a capture.
+
+    The crc16 over a frame including its own CRC bytes is 0 if the frame is
+    intact, so no CRC has to be extracted or swapped.
+
+    :param frames: Frames ending with their CRC
+    :returns: True for every intact frame, False otherwise
+    """
+    return [_crc16_update(0xFFFF, frame) == 0 for frame in frames]
+
+
+class ModbusCRC:
+    """Incremental modbus crc16.
+
+    Extend the CRC as data arrives instead of computing it over the whole
+    message again::
+
+        crc = ModbusCRC()
+        crc.update(header)
+        crc.update(payload)
+        crc.value == computeCRC(header + payload)
+    """
+
+    def __init__(self, data=b""):
+        """Initialize a new crc, optionally over data."""
+        self.crc = 0xFFFF
+        if data:
+            self.update(data)
+
+    def update(self, data):
+        """Extend the crc by data.
+
+        :param data: The next bytes of the message
+        :returns: self
+        """
+        self.crc = _crc16_update(self.crc, data)
+        return self
+
+    @property
+    def value(self):
+        """Return the CRC like computeCRC()."""
+        return ((self.crc << 8) & 0xFF00) | ((self.crc >> 8) & 0x00FF)
+
+    def copy(self):
+        """Return a copy, e.g. to try different continuations."""
+        crc = ModbusCRC()
+        crc.crc = self.crc
+        return crc
+
+
 def computeLRC(data):  # pylint: disable=invalid-name
     """Use to compute the longitudinal redundancy check against a string.
 
@@ -277,6 +363,8 @@ __all__ = [
     "default",
     "computeCRC",
     "checkCRC",
+    "checkFrameCRCs",
+    "ModbusCRC",
     "computeLRC",
     "checkLRC",
     "rtuFrameSize",
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Append-only recorder of the polled snapshots.
+
+A record file starts with a header of HEADER_SIZE bytes (magic and the column names as JSON),
+followed by fixed-size little endian records: the time as double and one float per column.
+Records are buffered in memory and appended in batches, so flash is written at most once every
+[RECORDER] FLUSH_INTERVAL seconds. Files are rotated by size, the newest one is
+serialinverter_<device>.rec, older ones get the suffix .1, .2, ...
+
+Read a file with RecordReader, or from the command line:
+
+    recorder.py /data/serialinverter/serialinverter_ttyUSB0.rec [--since <epoch>] [--until <epoch>]
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left
+from threading import Event, Lock, Thread
+from typing import Iterator, List, Tuple
+
+from utils import logger
+import utils
+
+MAGIC = b"SINVREC1"
+HEADER_SIZE = 512
+
+COLUMNS = (
+    "status",
+    "ac_power",
+    "energy_forwarded",
+    "L1_voltage", "L1_current", "L1_power", "L1_energy_forwarded",
+    "L2_voltage", "L2_current", "L2_power", "L2_energy_forwarded",
+    "L3_voltage", "L3_current", "L3_power", "L3_energy_forwarded",
+)
+RECORD = struct.Struct("<d%df" % len(COLUMNS))
+
+# Records kept in memory if the file can't be written, e.g. /data is full
+MAX_PENDING_RECORDS = 10000
+
+
+def get_header(columns=COLUMNS) -> bytes:
+    header = MAGIC + json.dumps({"columns": columns}).encode()
+    if len(header) > HEADER_SIZE:
+        raise ValueError("Too many columns for the record header")
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def read_columns(header: bytes) -> List[str]:
+    """
+    :return: the column names of a record file header
+    :raises ValueError: if it is not a record file header
+    """
+    if len(header) < HEADER_SIZE or not header.startswith(MAGIC):
+        raise ValueError("Not a record file")
+    return json.loads(header[len(MAGIC):HEADER_SIZE].rstrip(b"\0"))["columns"]
+
+
+def get_record_path(device_id) -> str:
+    return os.path.join(utils.RECORDER_DIRECTORY, "serialinverter_%s.rec" % device_id)
+
+
+class Recorder:
+    """
+    Packs every snapshot into a memory buffer, a writer thread appends the buffer to the record
+    file every FLUSH_INTERVAL seconds. Adding a snapshot never touches the file, so the poll loop
+    is never blocked by flash writes.
+    """
+
+    def __init__(self, path, flush_interval, max_size, files):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.files = files
+        self._pending = bytearray()
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._thread = Thread(target=self.run, name="recorder", daemon=True)
+
+    def start(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._thread.start()
+        logger.info("Recording to %s every %d s" % (self.path, self.flush_interval))
+
+    def add(self, timestamp: float, snapshot) -> None:
+        record = RECORD.pack(
+            timestamp,
+            snapshot.status or 0,
+            snapshot.overall.ac_power or 0,
+            snapshot.overall.energy_forwarded or 0,
+            snapshot.L1.ac_voltage or 0, snapshot.L1.ac_current or 0, snapshot.L1.ac_power or 0, snapshot.L1.energy_forwarded or 0,
+            snapshot.L2.ac_voltage or 0, snapshot.L2.ac_current or 0, snapshot.L2.ac_power or 0, snapshot.L2.energy_forwarded or 0,
+            snapshot.L3.ac_voltage or 0, snapshot.L3.ac_current or 0, snapshot.L3.ac_power or 0, snapshot.L3.energy_forwarded or 0,
+        )
+        with self._lock:
+            self._pending += record
+            if len(self._pending) > MAX_PENDING_RECORDS * RECORD.size:
+                del self._pending[:RECORD.size]
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        # Let a flush in progress finish first, two flushes would append at the same offset
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, bytearray()
+        if not pending:
+            return
+
+        try:
+            self.append(pending)
+        except OSError as e:
+            logger.error("Recording to %s failed: %s" % (self.path, e))
+            # Keep the records for the next attempt
+            with self._lock:
+                self._pending[0:0] = pending[-MAX_PENDING_RECORDS * RECORD.size:]
+
+    def append(self, records: bytes) -> None:
+        size = self.prepare()
+        if size + len(records) > self.max_size:
+            self.rotate()
+            size = self.prepare()
+
+        with open(self.path, "r+b") as file:
+            file.seek(size)
+            file.write(records)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def prepare(self) -> int:
+        """
+        Make sure the record file exists with a valid header and ends with a complete record.
+
+        :return: the size of the file
+        """
+        try:
+            with open(self.path, "rb") as file:
+                columns = read_columns(file.read(HEADER_SIZE))
+        except FileNotFoundError:
+            columns = None
+        except ValueError:
+            logger.warning("%s is not a record file, rotating it" % self.path)
+            self.rotate()
+            columns = None
+
+        if columns is not None and tuple(columns) != COLUMNS:
+            # Recorded by another version, don't mix the formats
+            self.rotate()
+            columns = None
+
+        if columns is None:
+            with open(self.path, "wb") as file:
+                file.write(get_header())
+            return HEADER_SIZE
+
+        # Drop a partial record left by a power loss while writing
+        size = os.path.getsize(self.path)
+        complete = HEADER_SIZE + (size - HEADER_SIZE) // RECORD.size * RECORD.size
+        if complete != size:
+            os.truncate(self.path, complete)
+        return complete
+
+    def rotate(self) -> None:
+        for index in range(self.files - 1, 0, -1):
+            source = self.path if index == 1 else "%s.%d" % (self.path, index - 1)
+            if os.path.exists(source):
+                os.replace(source, "%s.%d" % (self.path, index))
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RecordReader:
+    """
+    Reads a record file through a memory map. Records are ordered by time, range queries
+    are a binary search.
+    """
+
+    def __init__(self, path):
+        """
+        :raises ValueError: if the file is empty, e.g. the recorder was killed before its first flush,
+            or not a record file
+        """
+        self._file = open(path, "rb")
+        # An empty file can't be mapped, a file shorter than the header has no records either
+        if os.fstat(self._file.fileno()).st_size < HEADER_SIZE:
+            self._file.close()
+            raise ValueError("%s is empty or not a record file" % path)
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.columns = read_columns(self._map[:HEADER_SIZE])
+        except ValueError:
+            self.close()
+            raise
+        self.record = struct.Struct("<d%df" % len(self.columns))
+        self.count = (len(self._map) - HEADER_SIZE) // self.record.size
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index) -> Tuple:
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.record.unpack_from(self._map, HEADER_SIZE + index * self.record.size)
+
+    def timestamp(self, index) -> float:
+        return struct.unpack_from("<d", self._map, HEADER_SIZE + index * self.record.size)[0]
+
+    def range(self, since=0.0, until=float("inf")) -> Iterator[Tuple]:
+        """
+        :return: the records with since <= time < until
+        """
+        index = bisect_left(_Timestamps(self), since)
+        while index < self.count:
+            record = self[index]
+            if record[0] >= until:
+                break
+            yield record
+            index += 1
+
+
+class _Timestamps:
+    # Sequence of the record times for bisect, without unpacking whole records
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __getitem__(self, index):
+        return self.reader.timestamp(index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the records of a record file as CSV")
+    parser.add_argument("path")
+    parser.add_argument("--since", type=float, default=0.0, help="epoch seconds")
+    parser.add_argument("--until", type=float, default=float("inf"), help="epoch seconds")
+    args = parser.parse_args()
+
+    try:
+        reader = RecordReader(args.path)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    with reader:
+        print(",".join(["time"] + list(reader.columns)))
+        for record in reader.range(args.since, args.until):
+            print(",".join("%.3f" % record[0] if index == 0 else "%g" % value for index, value in enumerate(record)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
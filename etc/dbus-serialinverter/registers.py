@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import struct
+from typing import Dict, List, Tuple
+
+# A single FC3/FC4 request may return at most 125 registers (Modbus spec)
+MAX_READ_COUNT = 125
+
+# Poll tiers a field can be assigned to
+TIER_FAST = "fast"
+TIER_SLOW = "slow"
+TIER_STATIC = "static"
+
+# data type: (struct format, register count), all values are big endian
+DATA_TYPES = {
+    "u16": ("H", 1),
+    "s16": ("h", 1),
+    "u32": ("I", 2),
+    "s32": ("i", 2),
+    "float": ("f", 2),
+}
+
+
+class RegisterBlock:
+    """
+    A contiguous range of registers which is fetched with a single read request.
+    """
+
+    def __init__(self, address, count):
+        self.address = address
+        self.count = count
+
+    @property
+    def end(self) -> int:
+        return self.address + self.count
+
+    def contains(self, address, count=1) -> bool:
+        return self.address <= address and address + count <= self.end
+
+    def __repr__(self):
+        return "RegisterBlock(address=%s, count=%s)" % (self.address, self.count)
+
+
+class Field:
+    """
+    One value of a register map.
+
+    :param name: key of the decoded value
+    :param address: first register of the value
+    :param data_type: one of DATA_TYPES
+    :param scale: factor applied to the raw value
+    :param digits: decimals the scaled value is rounded to
+    :param path: optional (group, key) in Inverter.energy_data the value is written to, e.g. ("overall", "ac_power")
+    :param tier: poll tier of the value
+    """
+
+    def __init__(self, name, address, data_type, scale=1, digits=0, path=None, tier=TIER_FAST):
+        if data_type not in DATA_TYPES:
+            raise ValueError("Unsupported data type specified: %s" % data_type)
+
+        self.name = name
+        self.address = address
+        self.data_type = data_type
+        self.format, self.count = DATA_TYPES[data_type]
+        self.scale = scale
+        self.digits = digits
+        self.path = path
+        self.tier = tier
+
+    def __repr__(self):
+        return "Field(%s, address=%s, %s)" % (self.name, self.address, self.data_type)
+
+
+class RegisterMap:
+    """
+    A table of fields which is compiled once into read blocks and one struct per block.
+
+    Decoding a block is a single unpack of all its fields followed by scaling, there is no
+    per-field type dispatch at poll time.
+    """
+
+    def __init__(self, fields: List[Field], max_gap: int, max_count: int = MAX_READ_COUNT):
+        self.fields = fields
+        self.blocks = plan_blocks([(field.address, field.count) for field in fields], max_gap, max_count)
+        self._decoders = [self._compile(block) for block in self.blocks]
+        # Poll tiers of the fields of each block
+        self.block_tiers = [
+            frozenset(field.tier for field in fields if self._block_of(field) is block) for block in self.blocks
+        ]
+
+    def _compile(self, block):
+        fields = sorted(
+            [field for field in self.fields if self._block_of(field) is block],
+            key=lambda field: field.address,
+        )
+
+        # Unused registers between the fields are skipped as pad bytes
+        fmt = ">"
+        position = block.address
+        for field in fields:
+            if field.address < position:
+                raise ValueError("%s overlaps the previous field" % field)
+            if field.address > position:
+                fmt += "%dx" % ((field.address - position) * 2)
+            fmt += field.format
+            position = field.address + field.count
+        if block.end > position:
+            fmt += "%dx" % ((block.end - position) * 2)
+
+        scaling = tuple((field.name, field.scale, field.digits) for field in fields)
+        targets = tuple((field.name, field.path) for field in fields if field.path is not None)
+        return struct.Struct(">%dH" % block.count), struct.Struct(fmt), scaling, targets
+
+    def _block_of(self, field):
+        for block in self.blocks:
+            if block.contains(field.address, field.count):
+                return block
+        return None
+
+    def decode(self, index: int, registers: List[int], values: Dict, target=None) -> None:
+        """
+        Decode the registers returned for self.blocks[index] into values (by field name) and,
+        if given, into the target paths of the fields.
+        """
+        registers_struct, fields_struct, scaling, targets = self._decoders[index]
+        raw = fields_struct.unpack(registers_struct.pack(*registers))
+
+        for (name, scale, digits), data in zip(scaling, raw):
+            values[name] = round(data * scale, digits)
+
+        if target is not None:
+            for name, (group, key) in targets:
+                setattr(getattr(target, group), key, values[name])
+
+    def clear(self, index: int, target, values: Dict = None) -> None:
+        """
+        Reset the target paths of the fields of self.blocks[index] after the block could not be read,
+        and remove the fields from values if given.
+        """
+        for name, (group, key) in self._decoders[index][3]:
+            setattr(getattr(target, group), key, 0)
+        if values is not None:
+            for name, scale, digits in self._decoders[index][2]:
+                values.pop(name, None)
+
+
+def plan_blocks(ranges: List[Tuple[int, int]], max_gap: int, max_count: int = MAX_READ_COUNT) -> List[RegisterBlock]:
+    """
+    Merge (address, count) ranges into as few read requests as possible.
+
+    Two ranges end up in the same block if at most max_gap unused registers lie between
+    them and the resulting block does not exceed max_count registers.
+
+    :return: the blocks ordered by address
+    """
+    blocks = []
+    for address, count in sorted(set(ranges)):
+        if count > max_count:
+            raise ValueError("Range at %s exceeds %s registers" % (address, max_count))
+
+        if blocks:
+            block = blocks[-1]
+            end = max(block.end, address + count)
+            if address - block.end <= max_gap and end - block.address <= max_count:
+                block.count = end - block.address
+                continue
+
+        blocks.append(RegisterBlock(address, count))
+
+    return blocks
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+import sys
+import os
+from contextlib import contextmanager
+from itertools import count
+from threading import Condition, Lock
+from time import monotonic
+
+from utils import logger
+
+sys.path.insert(
+    1,
+    os.path.join(
+        os.path.dirname(__file__),
+        "/opt/victronenergy/dbus-serialinverter/pymodbus",
+    ),
+)
+
+from pymodbus.client import ModbusSerialClient
+
+from asyncbus import AsyncClientAdapter
+from metrics import BusMetrics
+
+# Priority classes of bus requests, lower is served first
+PRIORITY_CONTROL = 0 # writes, e.g. the power limit
+PRIORITY_TELEMETRY = 1 # fast tier reads
+PRIORITY_STATIC = 2 # slow and static tier reads, settings
+
+# Weight of the latest request in the estimated request duration
+DURATION_SMOOTHING = 0.2
+
+
+class StaleRequest(Exception):
+    """
+    Raised instead of granting the bus to a request which would finish after its deadline.
+    """
+
+
+class SerialBus:
+    """
+    One serial port shared by all inverters on it. Owns the ModbusSerialClient and schedules
+    the requests of all slaves on it: waiting requests are granted by priority class first, then
+    to the slave which was served least recently, so a slave reading several blocks can't starve
+    the others. Every request holds the bus on its own, so a control write waits for at most one
+    request in flight, never for a whole batch of low priority reads.
+
+    Requests may carry a deadline (monotonic time). A request waiting for the bus which is not
+    expected to finish before its deadline anymore, based on the average request duration, is
+    dropped with StaleRequest.
+    """
+
+    def __init__(self, port, baudrate, timeout):
+        self.port = port
+        self.baudrate = baudrate
+        if _async_mode:
+            self.client = AsyncClientAdapter(port, baudrate, timeout)
+        else:
+            self.client = ModbusSerialClient(method = 'rtu', port = port, baudrate = baudrate, stopbits = 1, parity = 'N', bytesize = 8, timeout = timeout)
+            logger.info("Creating ModbusSerialClient on port %s with baudrate %s" % (port, baudrate))
+
+        self.users = 0
+        self._condition = Condition()
+        self._busy = False
+        self._tickets = count()
+        self._waiting = dict() # ticket: (owner, priority)
+        self._last_served = dict() # owner: serial of the last grant
+        self._grants = count()
+        self.duration = 0.0 # estimated duration of one request in seconds
+        self.metrics = BusMetrics()
+        self._unanswered = set() # owners which asked for a reconnect since they last got an answer
+
+    @contextmanager
+    def transaction(self, owner, priority=PRIORITY_TELEMETRY, deadline=None):
+        """
+        Hold the bus for one request of owner (usually the slave id).
+
+        The deadline is only checked while the request waits behind others. A request which finds
+        the bus free is always sent: after a run of timeouts the estimated duration can exceed the
+        poll interval, and checking it then would drop every telemetry read.
+
+        :raises StaleRequest: if the request would finish after deadline while waiting for the bus
+        """
+        with self._condition:
+            ticket = next(self._tickets)
+            self._waiting[ticket] = (owner, priority)
+            try:
+                while True:
+                    # A request is only dropped while it waits for others, once the bus is free it is sent
+                    if not self._busy and self._next_ticket() == ticket:
+                        break
+                    if self._expired(deadline):
+                        raise StaleRequest("Request of slave %s dropped, it would miss its deadline" % owner)
+                    self._condition.wait(None if deadline is None else deadline - self.duration - monotonic())
+            except StaleRequest:
+                self.metrics.record_dropped()
+                del self._waiting[ticket]
+                self._condition.notify_all()
+                raise
+            del self._waiting[ticket]
+            self._busy = True
+            self._last_served[owner] = next(self._grants)
+
+        started = monotonic()
+        try:
+            yield self.client
+        finally:
+            with self._condition:
+                duration = monotonic() - started
+                self.duration += (duration - self.duration) * DURATION_SMOOTHING
+                self.metrics.record(duration, getattr(self.client, "silent_wait", 0), getattr(self.client, "idle_gap", None))
+                self._busy = False
+                self._condition.notify_all()
+
+    def reconnect(self, owner) -> None:
+        """
+        Close the port once every user of the bus gets no answer anymore, e.g. after the USB adapter
+        was unplugged. The next request opens it again. As long as another slave answers, the port is
+        left open, a single slave which doesn't answer is no reason to interrupt the others.
+        """
+        with self.transaction(owner, PRIORITY_CONTROL) as client:
+            self._unanswered.add(owner)
+            if len(self._unanswered) >= self.users:
+                logger.info("No answer from any slave on %s, reopening the port" % self.port)
+                client.close()
+                self._unanswered.clear()
+
+    def answered(self, owner) -> None:
+        # The owner got an answer again, the port works
+        self._unanswered.discard(owner)
+
+    def _expired(self, deadline):
+        return deadline is not None and monotonic() + self.duration > deadline
+
+    def _next_ticket(self):
+        # Highest priority first, then least recently served owner, oldest ticket first among equals
+        def order(ticket):
+            owner, priority = self._waiting[ticket]
+            return priority, self._last_served.get(owner, -1), ticket
+
+        return min(self._waiting, key=order)
+
+
+_buses = dict()
+_buses_lock = Lock()
+_async_mode = False
+
+
+def set_async_mode(enabled: bool) -> None:
+    """
+    Serve all buses created afterwards from the shared asyncio IO loop instead of a blocking client each.
+    """
+    global _async_mode
+    _async_mode = enabled
+
+
+def get_serial_bus(port, baudrate, timeout) -> SerialBus:
+    """
+    :return: the bus of port, it is created on first use and shared afterwards
+    """
+    with _buses_lock:
+        bus = _buses.get((port, baudrate))
+        if bus is None:
+            bus = SerialBus(port, baudrate, timeout)
+            _buses[(port, baudrate)] = bus
+        bus.users += 1
+        return bus
+
+
+def release_serial_bus(bus: SerialBus) -> None:
+    # Close the port when its last inverter is gone
+    with _buses_lock:
+        bus.users -= 1
+        if bus.users <= 0:
+            bus.client.close()
+            _buses.pop((bus.port, bus.baudrate), None)
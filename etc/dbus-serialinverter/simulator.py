@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Solis inverter simulator for testing the driver without hardware.
+
+Serves the Solis register map with the bundled pymodbus server on a Linux pty. A second pty is
+linked to it like a null modem cable, the driver (or benchmark.py) opens that one, e.g.:
+
+    ./simulator.py --link /tmp/ttySIM0 --slaves 1,2 --delay 0.02 --jitter 0.01 --drop 0.01
+    ./dbus-serialinverter.py /tmp/ttySIM0
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import termios
+import tty
+from functools import partial
+from threading import Thread
+from time import sleep
+
+sys.path.insert(
+    1,
+    os.path.join(
+        os.path.dirname(__file__),
+        "/opt/victronenergy/dbus-serialinverter/pymodbus",
+    ),
+)
+
+from pymodbus.datastore import ModbusServerContext, ModbusSimulatorContext
+from pymodbus.server.async_io import ModbusSerialServer, ModbusSingleRequestHandler
+from pymodbus.transaction import ModbusRtuFramer
+
+from utils import logger
+
+
+class Impairments:
+    """
+    Faults applied to every response of the simulator.
+
+    :param delay: response delay in seconds
+    :param jitter: random variation of the delay in seconds (+/-)
+    :param drop: probability of a response not being sent at all
+    :param corrupt: probability of a response being sent with a wrong CRC
+    :param noise: probability of a noise byte in front of a response
+    """
+
+    def __init__(self, delay=0.0, jitter=0.0, drop=0.0, corrupt=0.0, noise=0.0):
+        self.delay = delay
+        self.jitter = jitter
+        self.drop = drop
+        self.corrupt = corrupt
+        self.noise = noise
+        self.sent = 0
+        self.dropped = 0
+        self.corrupted = 0
+        self.noisy = 0
+
+
+class ImpairedRequestHandler(ModbusSingleRequestHandler):
+    """
+    Serial request handler which sends the responses through the server's Impairments.
+    """
+
+    def send(self, message, *addr, **kwargs):
+        impairments = self.server.impairments
+        if not message.should_respond:
+            return
+        if random.random() < impairments.drop:
+            impairments.dropped += 1
+            return
+
+        packet = self.framer.buildPacket(message)
+        if random.random() < impairments.corrupt:
+            impairments.corrupted += 1
+            packet = packet[:-1] + bytes([packet[-1] ^ 0xFF])
+        if random.random() < impairments.noise:
+            impairments.noisy += 1
+            packet = bytes([random.randrange(256)]) + packet
+
+        impairments.sent += 1
+        delay = max(0.0, impairments.delay + random.uniform(-impairments.jitter, impairments.jitter))
+        send = partial(super(ImpairedRequestHandler, self).send, packet, *addr, skip_encoding=True)
+        if delay:
+            self.server.loop.call_later(delay, send)
+        else:
+            send()
+
+
+def action_power(registers, inx, cell, kwargs):
+    # u32 value drawn from [min, max] on every read, like a PV output under passing clouds
+    value = random.randint(kwargs["min"], kwargs["max"])
+    registers[inx].value = value >> 16
+    registers[inx + 1].value = value & 0xFFFF
+
+
+def action_jitter(registers, inx, cell, kwargs):
+    # u16 value drawn from [min, max] on every read
+    registers[inx].value = random.randint(kwargs["min"], kwargs["max"])
+
+
+def action_power_limit(registers, inx, cell, kwargs):
+    # The active limit (3049) follows the limit written to 3051
+    registers[inx].value = registers[inx + 2].value
+
+
+SIMULATOR_ACTIONS = {
+    "power": action_power,
+    "jitter": action_jitter,
+    "power_limit": action_power_limit,
+}
+
+
+def get_solis_config(max_ac_power=800, dark=False):
+    """
+    :return: a ModbusSimulatorContext config of a single phase Solis inverter, generating or dark (at night)
+    """
+    dc_voltage = 0 if dark else 3000
+    ac_power = {"min": 0, "max": 0} if dark else {"min": max_ac_power // 4, "max": max_ac_power * 3 // 4}
+    return {
+        "setup": {
+            "co size": 0,
+            "di size": 0,
+            "hr size": 3100,
+            "ir size": 3100,
+            "shared blocks": True,
+            "type exception": False,
+            "defaults": {
+                "value": {"bits": 0, "uint16": 0, "uint32": 0, "float32": 0.0, "string": " "},
+                "action": {"bits": None, "uint16": None, "uint32": None, "float32": None, "string": None},
+            },
+        },
+        "invalid": [],
+        "write": [3051],
+        "bits": [],
+        "uint16": [
+            [1, 2998],
+            {"addr": 2999, "value": 224}, # product model
+            {"addr": 3000, "value": 107}, # DSP version
+            3001,
+            {"addr": 3002, "value": 0}, # output type: single phase
+            3003,
+            [3006, 3013],
+            {"addr": 3014, "value": 1234}, # energy forwarded, 123.4 kWh
+            3015,
+            [3016, 3020],
+            {"addr": 3021, "value": dc_voltage}, # DC voltage 1
+            {"addr": 3022, "value": 0 if dark else 20}, # DC current 1
+            {"addr": 3023, "value": dc_voltage}, # DC voltage 2
+            [3024, 3032],
+            {"addr": 3033, "action": "jitter", "kwargs": {"min": 2280, "max": 2320}},
+            {"addr": [3034, 3035], "value": 2300},
+            {"addr": 3036, "action": "jitter", "kwargs": {"min": 10, "max": 30}},
+            {"addr": [3037, 3038], "value": 20},
+            [3039, 3042],
+            {"addr": 3043, "value": 3}, # generating
+            [3044, 3048],
+            {"addr": 3049, "value": 10000, "action": "power_limit"},
+            3050,
+            {"addr": 3051, "value": 10000},
+            [3052, 3059],
+            {"addr": [3060, 3063], "value": 0x1234},
+            [3064, 3099],
+        ],
+        "uint32": [
+            {"addr": 3004, "action": "power", "kwargs": ac_power},
+        ],
+        "float32": [],
+        "string": [],
+        "repeat": [],
+    }
+
+
+def open_pty():
+    """
+    :return: the master fd, the path and the fd of the slave end of a raw pty
+    """
+    master, slave = os.openpty()
+    tty.setraw(slave, termios.TCSANOW)
+    return master, os.ttyname(slave), slave
+
+
+def pace(data, baudrate):
+    # Time the data takes on the wire, 11 bits per byte
+    if baudrate:
+        sleep(len(data) * 11 / baudrate)
+
+
+def relay(source, destination, baudrate):
+    while True:
+        try:
+            data = os.read(source, 256)
+        except OSError:
+            # No process has the other end open (yet)
+            sleep(0.01)
+            continue
+        pace(data, baudrate)
+        os.write(destination, data)
+
+
+def link_ptys(baudrate):
+    """
+    Connect two ptys like a null modem cable, the data is paced to baudrate.
+
+    :return: the paths of the two ends and their fds, which must stay open while the link is used
+    """
+    server_master, server_port, server_fd = open_pty()
+    client_master, client_port, client_fd = open_pty()
+    for source, destination in ((server_master, client_master), (client_master, server_master)):
+        Thread(target=relay, args=(source, destination, baudrate), name="relay", daemon=True).start()
+    return server_port, client_port, (server_fd, client_fd)
+
+
+async def serve(args):
+    server_port, client_port, fds = link_ptys(args.baudrate)
+    if args.link:
+        if os.path.lexists(args.link):
+            os.remove(args.link)
+        os.symlink(client_port, args.link)
+        client_port = args.link
+
+    slaves = {
+        int(slave): ModbusSimulatorContext(get_solis_config(args.max_ac_power, args.dark), SIMULATOR_ACTIONS)
+        for slave in args.slaves.split(",")
+    }
+    server = ModbusSerialServer(
+        ModbusServerContext(slaves=slaves, single=False),
+        framer=ModbusRtuFramer,
+        port=server_port,
+        baudrate=args.baudrate or 9600,
+        handler=ImpairedRequestHandler,
+        ignore_missing_slaves=True,
+        loop=asyncio.get_running_loop(),
+    )
+    server.impairments = Impairments(args.delay, args.jitter, args.drop, args.corrupt, args.noise)
+    await server.start()
+
+    logger.info(
+        "Simulating Solis slave(s) %s on %s (delay %s s, jitter %s s, drop %s, corrupt %s, noise %s)"
+        % (args.slaves, client_port, args.delay, args.jitter, args.drop, args.corrupt, args.noise)
+    )
+    await server.serve_forever()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Solis inverter simulator on a pty")
+    parser.add_argument("--link", default="/tmp/ttySIM0", help="symlink to the pty the driver opens")
+    parser.add_argument("--slaves", default="1", help="slave id(s), e.g. 1,2,3")
+    parser.add_argument("--baudrate", type=int, default=9600, help="wire speed to emulate, 0 for unlimited")
+    parser.add_argument("--max-ac-power", type=int, default=800)
+    parser.add_argument("--dark", action="store_true", help="simulate the night: no AC power, no DC voltage")
+    parser.add_argument("--delay", type=float, default=0.0, help="response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="response delay variation in seconds")
+    parser.add_argument("--drop", type=float, default=0.0, help="probability of dropping a response")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="probability of corrupting the CRC of a response")
+    parser.add_argument("--noise", type=float, default=0.0, help="probability of a noise byte in front of a response")
+    return parser
+
+
+def main():
+    asyncio.run(serve(get_parser().parse_args()))
+
+
+if __name__ == "__main__":
+    main()
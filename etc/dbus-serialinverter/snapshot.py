@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+
+class PhaseData:
+    """
+    AC values of one phase.
+    """
+
+    __slots__ = ("ac_voltage", "ac_current", "ac_power", "energy_forwarded")
+
+    def __init__(self):
+        self.ac_voltage = None
+        self.ac_current = None
+        self.ac_power = None
+        self.energy_forwarded = None
+
+    def copy(self) -> "PhaseData":
+        data = PhaseData.__new__(PhaseData)
+        data.ac_voltage = self.ac_voltage
+        data.ac_current = self.ac_current
+        data.ac_power = self.ac_power
+        data.energy_forwarded = self.energy_forwarded
+        return data
+
+
+class OverallData:
+    """
+    Values of the inverter as a whole.
+    """
+
+    __slots__ = ("ac_power", "energy_forwarded", "power_limit", "active_power_limit")
+
+    def __init__(self):
+        self.ac_power = None
+        self.energy_forwarded = None
+        self.power_limit = None
+        self.active_power_limit = None
+
+    def copy(self) -> "OverallData":
+        data = OverallData.__new__(OverallData)
+        data.ac_power = self.ac_power
+        data.energy_forwarded = self.energy_forwarded
+        data.power_limit = self.power_limit
+        data.active_power_limit = self.active_power_limit
+        return data
+
+
+class EnergySnapshot:
+    """
+    The energy data of one poll.
+
+    The poller fills a private instance (Inverter.energy_data) field by field. When a poll is done
+    a copy is published by swapping the Inverter.snapshot reference, so readers always see a
+    complete poll. Published snapshots are never modified.
+    """
+
+    __slots__ = ("L1", "L2", "L3", "overall", "status", "online")
+
+    PHASES = ("L1", "L2", "L3")
+
+    def __init__(self):
+        self.L1 = PhaseData()
+        self.L2 = PhaseData()
+        self.L3 = PhaseData()
+        self.overall = OverallData()
+        self.status = None
+        self.online = True
+
+    def phase(self, name) -> PhaseData:
+        return getattr(self, name)
+
+    def phases(self):
+        return self.L1, self.L2, self.L3
+
+    def copy(self) -> "EnergySnapshot":
+        snapshot = EnergySnapshot.__new__(EnergySnapshot)
+        snapshot.L1 = self.L1.copy()
+        snapshot.L2 = self.L2.copy()
+        snapshot.L3 = self.L3.copy()
+        snapshot.overall = self.overall.copy()
+        snapshot.status = self.status
+        snapshot.online = self.online
+        return snapshot
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
+from threading import Lock
+from time import monotonic
 
 from inverter import Inverter
+from serialbus import PRIORITY_CONTROL, PRIORITY_TELEMETRY, PRIORITY_STATIC
 from utils import logger
 import utils
 
@@ -14,26 +17,83 @@ sys.path.insert(
     ),
 )
 
-from pymodbus.client import ModbusSerialClient
-from pymodbus.constants import Endian
-from pymodbus.payload import BinaryPayloadDecoder
+
+from energy import EnergyIntegrator, get_state_path, split_power
+from probe import probe_timeout
+from registers import Field, RegisterMap, TIER_SLOW, TIER_STATIC
+from serialbus import get_serial_bus, release_serial_bus
 
 class Solis(Inverter):
     INVERTERTYPE = "Solis"
+    TIMEOUT = 1
+
+    # Input registers read by read_status_data()
+    REGISTER_MAP = [
+        # Output type: Single or 3-Phase inverter
+        Field("output_type", 3002, "u16", tier=TIER_STATIC),
+        Field("ac_power", 3004, "u32", path=("overall", "ac_power")),
+        Field("dc_voltage_1", 3021, "u16", 0.1, 1),
+        Field("dc_voltage_2", 3023, "u16", 0.1, 1),
+        Field("energy_forwarded", 3014, "u16", 0.1, 2, path=("overall", "energy_forwarded"), tier=TIER_SLOW),
+        Field("ac_voltage_l1", 3033, "u16", 0.1, 0),
+        Field("ac_voltage_l2", 3034, "u16", 0.1, 0),
+        Field("ac_voltage_l3", 3035, "u16", 0.1, 0),
+        Field("ac_current_l1", 3036, "u16", 0.1, 2),
+        Field("ac_current_l2", 3037, "u16", 0.1, 2),
+        Field("ac_current_l3", 3038, "u16", 0.1, 2),
+        Field("status", 3043, "u16"),
+        Field("power_limit", 3049, "u16", 0.01, 0, tier=TIER_SLOW),
+    ]
+
+    # Input registers read outside the poll tiers: by test_connection(), get_settings() and apply_power_limit()
+    PRODUCT_MAP = [
+        Field("product_model", 2999, "u16"),
+    ]
+    SETTINGS_MAP = [
+        Field("dsp_version", 3000, "u16"),
+        Field("power_limit", 3049, "u16", 0.01, 0),
+        # Serial number, 4 hex digits per register in reverse order
+        Field("serial_1", 3060, "u16"),
+        Field("serial_2", 3061, "u16"),
+        Field("serial_3", 3062, "u16"),
+        Field("serial_4", 3063, "u16"),
+    ]
+    POWER_LIMIT_MAP = [
+        Field("power_limit", 3049, "u16", 0.01, 0),
+    ]
+
+    # Solis status: Victron status
+    STATUS_CODES = {
+        0: 0, # Waiting
+        1: 1, # OpenRun
+        2: 2, # SoftRun
+        3: 7, # Generating
+    }
     
     def __init__(self, port, baudrate, slave):
         super(Solis, self).__init__(port, baudrate, slave)
         self.type = self.INVERTERTYPE
 
-        self.client = ModbusSerialClient(method = 'rtu', port = port, baudrate = baudrate, stopbits = 1, parity = 'N', bytesize = 8, timeout = 1)
-        logger.info("Creating ModbusSerialClient on port %s with baudrate %s" % (port, baudrate))
+        # All Solis inverters on a port share its client, the bus arbitrates their requests
+        self.bus = get_serial_bus(port, baudrate, self.TIMEOUT)
+        self.client = self.bus.client
+
+        self.register_fields = self.REGISTER_MAP
+        self.product_map = RegisterMap(self.PRODUCT_MAP, utils.INVERTER_REGISTER_GAP)
+        self.settings_map = RegisterMap(self.SETTINGS_MAP, utils.INVERTER_REGISTER_GAP)
+        self.power_limit_map = RegisterMap(self.POWER_LIMIT_MAP, utils.INVERTER_REGISTER_GAP)
+        self.power_limit_percent = None
+        self.power_limit_lock = Lock()
+        # Per-phase energy of 3-phase inverters, created once the output type is known
+        self.energy_integrator = None
         
     def test_connection(self):
         try:
             logger.debug("test_connection(): Connected!")
             # Product model
-            success, self.product_model = self.read_input_registers(2999, 1, "u16", 1, 0)
+            success, values = self.read_fields(self.product_map, PRIORITY_TELEMETRY)
             if (success):
+                self.product_model = values["product_model"]
                 logger.debug("Product model: %s" % self.product_model)
                 if (self.product_model == 224):
                     return self.get_settings()
@@ -46,6 +106,26 @@ class Solis(Inverter):
             logger.debug("test_connection(): IOError")
             return False
 
+    def set_timeout(self, timeout):
+        timeout = timeout or self.TIMEOUT
+        self.client.params.timeout = timeout
+        if (self.client.socket):
+            self.client.socket.timeout = timeout
+
+    def reconnect(self):
+        super(Solis, self).reconnect()
+        # The bus is shared, it only reopens the port if none of its slaves answers anymore
+        self.bus.reconnect(self.slave)
+
+    def save_state(self):
+        if (self.energy_integrator is not None):
+            self.energy_integrator.save()
+
+    def close(self):
+        if (self.bus is not None):
+            release_serial_bus(self.bus)
+            self.bus = None
+
     def get_settings(self):
         # Static info from config
         self.max_ac_power = utils.INVERTER_MAX_AC_POWER
@@ -53,36 +133,54 @@ class Solis(Inverter):
         self.poll_interval = utils.INVERTER_POLL_INTERVAL
         self.position = utils.INVERTER_POSITION
 
+        success, values = self.read_fields(self.settings_map, PRIORITY_STATIC)
+        if (not success):
+            logger.debug("Error reading settings")
+            return False
+
         # Software version
-        success, self.hardware_version = self.read_input_registers(3000, 1, "u16", 1, 0)
+        self.hardware_version = values["dsp_version"]
         logger.debug("DSP version: %s" % self.hardware_version)
 
         # Serial
-        res = self.client.read_input_registers(address = 3060,
-                                count = 4,
-                                slave = self.slave)
-
-        if not res.isError():
-            serialparts = []
-            for x in res.registers:
-                serialparts.append((hex(x)[2:])[::-1])
-            
-            self.serial_number = ''.join(serialparts)
-            logger.debug("Serial: %s" % self.serial_number)
-        else:
-            logger.debug("Error reading serial number")
-            return False
+        serialparts = []
+        for name in ["serial_1", "serial_2", "serial_3", "serial_4"]:
+            serialparts.append((hex(values[name])[2:])[::-1])
+
+        self.serial_number = ''.join(serialparts)
+        logger.debug("Serial: %s" % self.serial_number)
 
         # Power limit
-        success, power_limit = self.read_input_registers(3049, 1, "u16", 0.01, 0)
-        if (success):
-            power_limit_watts = float(self.max_ac_power * (int(power_limit) / 100))
-            self.energy_data['overall']['power_limit'] = power_limit_watts
-            self.energy_data['overall']['active_power_limit'] = power_limit_watts
-            logger.debug("Active power limit: %d W (%d %%)" % (power_limit_watts, power_limit))
-        
+        self.set_active_power_limit(values["power_limit"])
+        self.energy_data.overall.power_limit = self.energy_data.overall.active_power_limit
+
         return True
 
+    def set_active_power_limit(self, power_limit):
+        power_limit_watts = float(self.max_ac_power * (int(power_limit) / 100))
+        self.energy_data.overall.active_power_limit = power_limit_watts
+        self.power_limit_percent = int(power_limit)
+        logger.debug("Active power limit: %d W (%d %%)" % (power_limit_watts, power_limit))
+
+    def apply_power_limit(self, urgent=False):
+        # Write the requested power limit if it differs from the active one and confirm it by reading it back
+        with self.power_limit_lock:
+            if (self.power_limit_percent is None or self.energy_data.overall.power_limit is None):
+                return True
+
+            new_power_limit = int(self.energy_data.overall.power_limit / (self.max_ac_power / 100))
+            if (new_power_limit == self.power_limit_percent):
+                return True
+
+            logger.info("Power limit has changed from %s to %s" % (self.power_limit_percent, new_power_limit))
+            if (not self.write_registers(3051, new_power_limit * 100)):
+                return False
+
+            priority = PRIORITY_CONTROL if urgent else PRIORITY_TELEMETRY
+            success, values = self.read_fields(self.power_limit_map, priority)
+            self.set_active_power_limit(values["power_limit"] if success else new_power_limit)
+            return success and self.power_limit_percent == new_power_limit
+
     def refresh_data(self):
         # call all functions that will refresh the inverter data.
         # This will be called for every iteration (1 second)
@@ -90,178 +188,138 @@ class Solis(Inverter):
         result = self.read_status_data()
         return result
 
-    def read_input_registers(self, address, count, data_type, scale, digits):
-        connection = self.client.connect()
-        if (connection):
-            res = self.client.read_input_registers(address = address,
-                                    count = count,
-                                    slave = self.slave)
-
-            logger.debug("Read input register - address=%s, count=%s, slave=%s" % (address, count, self.slave))
-
-            if not res.isError():
-                decoder = BinaryPayloadDecoder.fromRegisters(res.registers, Endian.Big)
-
-                if (data_type == 'string'):
-                    data = decoder.decode_string(8)
-                elif (data_type == 'float'):
-                    data = decoder.decode_32bit_float()  
-                elif (data_type == 'u16'):
-                    data = decoder.decode_16bit_uint()  
-                elif (data_type == 'u32'):
-                    data = decoder.decode_32bit_uint()      
-                else:
-                    logger.warn("Unsupported data type specified: %s" % data_type)
-                    return False, 0
+    def read_block(self, block, priority=PRIORITY_TELEMETRY, deadline=None):
+        # One request, holding the bus shared with the other slaves on this port
+        with self.bus.transaction(self.slave, priority, deadline):
+            connection = self.client.connect()
+            if (connection):
+                res = self.client.read_input_registers(address = block.address,
+                                        count = block.count,
+                                        slave = self.slave)
 
-                logger.debug("Register: %s - Raw data: %s" % (address, data))
+                logger.debug("Read input register - address=%s, count=%s, slave=%s" % (block.address, block.count, self.slave))
 
-                # Scale
-                data = round(data * scale, digits)
-                logger.debug("Register: %s - Scaled data: %s" % (address, data))
-                return True, data
+                if not res.isError():
+                    return res.registers
+                else:
+                    logger.error("Error reading register %s (count %s, slave %s)" % (block.address, block.count, self.slave))
+                    logger.debug(res)
             else:
-                logger.error("Error reading register %s" % address)
-                logger.debug(res)
-        else:
-            logger.error("No connection")
+                logger.error("No connection")
+
+        return None
 
-        return False, 0
+    def read_fields(self, register_map, priority):
+        # Read and decode a register map outside the poll tiers, all blocks with the given priority
+        success, complete, values = self.read_register_map(register_map, priority=priority)
+        return success, values
 
     def write_registers(self, address, value):
-        connection = self.client.connect()
-        if (connection):
-            res = self.client.write_registers(address, value, slave = self.slave)
-            logger.debug("Write register - address=%s, value=%s, slave=%s" % (address, value, self.slave))
-            if not res.isError():
-                logger.debug(res)
-                return True
+        # Writes are control requests and go ahead of all pending reads
+        with self.bus.transaction(self.slave, PRIORITY_CONTROL):
+            connection = self.client.connect()
+            if (connection):
+                res = self.client.write_registers(address, value, slave = self.slave)
+                logger.debug("Write register - address=%s, value=%s, slave=%s" % (address, value, self.slave))
+                if not res.isError():
+                    logger.debug(res)
+                    return True
+                else:
+                    logger.error("Error writing register %s" % address)
             else:
-                logger.error("Error writing register %s" % address)
-        else:
-            logger.error("No connection")
+                logger.error("No connection")
 
         return False
 
     def read_status_data(self):
-        error = False
-
-        # Output type: Single or 3-Phase inverter
-        success, output_type = self.read_input_registers(3002, 1, "u16", 1, 0)
-        if (not success):
-            error = True
-
-        # AC power overall
-        success, self.energy_data['overall']['ac_power'] = self.read_input_registers(3004, 2, "u32", 1, 0)
-        if (not success):
-            error = True
+        # Fetch and decode the fields due on this poll, overall values are written to energy_data directly
+        success, values = self.read_due_registers()
+        error = not success
+        # Latest value of every field: fields of blocks dropped as stale keep their previous value,
+        # fields of failed blocks are missing
+        fields = self.register_values
+
+        if (self.register_values.get("output_type", 0) == 0):
+            # Single phase inverter
 
-        # Energy forwarded overall
-        success, self.energy_data['overall']['energy_forwarded'] = self.read_input_registers(3014, 1, "u16", 0.1, 2)
-        if (not success):
-            error = True
+            for phase in ['L1', 'L2', 'L3']:
+                self.energy_data.phase(phase).ac_voltage = 0.0
+                self.energy_data.phase(phase).ac_current = 0.0
+                self.energy_data.phase(phase).ac_power = 0.0
+                self.energy_data.phase(phase).energy_forwarded = 0.0
 
-        if (output_type == 0):
-            # Single phase inverter
-
-            for phase in ['L1', 'L2', 'L3']:
-                self.energy_data[phase]['ac_voltage'] = 0.0
-                self.energy_data[phase]['ac_current'] = 0.0
-                self.energy_data[phase]['ac_power'] = 0.0
-                self.energy_data[phase]['energy_forwarded'] = 0.0
-            
-            # AC voltage phase
-            success, self.energy_data[self.phase]['ac_voltage'] = self.read_input_registers(3035, 1, "u16", 0.1, 0)
-            if (not success):
-                error = True
-
-            # AC current phase
-            success, self.energy_data[self.phase]['ac_current'] = self.read_input_registers(3038, 1, "u16", 0.1, 2)
-            if (not success):
-                error = True
-
-            # AC power phase
-            self.energy_data[self.phase]['ac_power'] = self.energy_data['overall']['ac_power']
-
-            # Energy forwarded
-            self.energy_data[self.phase]['energy_forwarded'] = self.energy_data['overall']['energy_forwarded']
+            self.energy_data.phase(self.phase).ac_voltage = fields.get("ac_voltage_l3", 0)
+            self.energy_data.phase(self.phase).ac_current = fields.get("ac_current_l3", 0)
+            self.energy_data.phase(self.phase).ac_power = self.energy_data.overall.ac_power
+            self.energy_data.phase(self.phase).energy_forwarded = self.energy_data.overall.energy_forwarded
         else:
-            # 3-Phase inverter
-            # AC voltage L1
-            success, self.energy_data['L1']['ac_voltage'] = self.read_input_registers(3033, 1, "u16", 0.1, 0)
-            if (not success):
-                error = True
-
-            # AC voltage L2
-            success, self.energy_data['L2']['ac_voltage'] = self.read_input_registers(3034, 1, "u16", 0.1, 0)
-            if (not success):
-                error = True
-
-            # AC voltage L3
-            success, self.energy_data['L3']['ac_voltage'] = self.read_input_registers(3035, 1, "u16", 0.1, 0)
-            if (not success):
-                error = True
-
-            # AC current L1
-            success, self.energy_data['L1']['ac_current'] = self.read_input_registers(3036, 1, "u16", 0.1, 2)
-            if (not success):
-                error = True
-
-            # AC current L2
-            success, self.energy_data['L2']['ac_current'] = self.read_input_registers(3037, 1, "u16", 0.1, 2)
-            if (not success):
-                error = True
-
-            # AC current L3
-            success, self.energy_data['L3']['ac_current'] = self.read_input_registers(3038, 1, "u16", 0.1, 2)
-            if (not success):
-                error = True
-
-            # Energy forwarded L1
-            self.energy_data['L1']['energy_forwarded'] = 0
-
-            # Energy forwarded L2
-            self.energy_data['L2']['energy_forwarded'] = 0
-
-            # Energy forwarded L3
-            self.energy_data['L3']['energy_forwarded'] = 0
+            # 3-Phase inverter, only the total power and energy are reported.
+            # The phase powers are split from V * I and integrated to per-phase energy.
+            if (self.energy_integrator is None):
+                self.energy_integrator = EnergyIntegrator(get_state_path(self.port, self.slave))
+
+            for phase in ['L1', 'L2', 'L3']:
+                self.energy_data.phase(phase).ac_voltage = fields.get("ac_voltage_" + phase.lower(), 0)
+                self.energy_data.phase(phase).ac_current = fields.get("ac_current_" + phase.lower(), 0)
+
+            phases = self.energy_data.phases()
+            power = split_power(self.energy_data.overall.ac_power or 0,
+                                [phase.ac_voltage for phase in phases], [phase.ac_current for phase in phases])
+            for phase, phase_power in zip(phases, power):
+                phase.ac_power = round(phase_power)
+
+            # Only complete samples are integrated, a sample dropped as stale is bridged by the next one
+            if (all(field in values for field in ("ac_power", "ac_voltage_l1", "ac_current_l1", "ac_voltage_l2",
+                                                   "ac_current_l2", "ac_voltage_l3", "ac_current_l3"))):
+                self.energy_integrator.add(monotonic(), power)
+            if ("energy_forwarded" in values):
+                self.energy_integrator.reconcile(values["energy_forwarded"])
+            for phase, energy in zip(phases, self.energy_integrator.phase_energy()):
+                phase.energy_forwarded = energy
 
         # Status
-        success, status = self.read_input_registers(3043, 1, "u16", 1, 0)
-        if (success):
-            # Victron: # 0=Startup 0; 1=Startup 1; 2=Startup 2; 3=Startup 3; 4=Startup 4; 5=Startup 5; 6=Startup 6; 7=Running; 8=Standby; 9=Boot loading; 10=Error
-            if (status == 0):
-                self.status = 0 # Waiting
-            elif (status == 1):
-                self.status = 1 # OpenRun
-            elif (status == 2):
-                self.status = 2 # SoftRun
-            elif (status == 3):
-                self.status = 7 # Generating
-            else:
-                self.status = 10 # Fault
+        # Victron: # 0=Startup 0; 1=Startup 1; 2=Startup 2; 3=Startup 3; 4=Startup 4; 5=Startup 5; 6=Startup 6; 7=Running; 8=Standby; 9=Boot loading; 10=Error
+        if ("status" in fields):
+            self.status = self.STATUS_CODES.get(fields["status"], 10) # Fault
         else:
             self.status = 8 # Off
-            error = True
 
         logger.debug("Inverter status: %s" % self.status)
 
-        # Power limit
-        success, power_limit = self.read_input_registers(3049, 1, "u16", 0.01, 0)
-        if (success):
-            power_limit_watts = float(self.max_ac_power * (int(power_limit) / 100))
-            self.energy_data['overall']['active_power_limit'] = power_limit_watts
-            logger.debug("Active power limit: %d W (%d %%)" % (power_limit_watts, power_limit))
-
-            if (power_limit_watts != self.energy_data['overall']['power_limit']):
-                new_power_limit = self.energy_data['overall']['power_limit'] / (self.max_ac_power / 100)
-                logger.info("Power limit has changed from %s to %s" % (power_limit, new_power_limit))
-                self.write_registers(3051, int(new_power_limit) * 100)
-        else:
-            error = True
+        # Power limit readback, only read in the slow tier
+        if ("power_limit" in values):
+            with self.power_limit_lock:
+                self.set_active_power_limit(values["power_limit"])
+
+        # Power limit, normally written by apply_power_limit() right after a change.
+        # Also compared here so a limit lost by the inverter is restored.
+        self.apply_power_limit()
 
         # Check if error or not
         if (not error):
             return True
         else:
-            return False
\ No newline at end of file
+            return False
+
+    def is_dark(self):
+        dc_voltage = max(self.register_values.get("dc_voltage_1", 0), self.register_values.get("dc_voltage_2", 0))
+        return (self.energy_data.overall.ac_power == 0 and dc_voltage < utils.INVERTER_SLEEP_DC_VOLTAGE)
+
+    def wake_probe(self):
+        # A single read of the DC voltages, with a timeout just long enough for the reply
+        with self.bus.transaction(self.slave, PRIORITY_STATIC):
+            self.set_timeout(probe_timeout(self.baudrate, 3))
+            try:
+                if (not self.client.connect()):
+                    return None
+                res = self.client.read_input_registers(address = 3021, count = 3, slave = self.slave)
+            finally:
+                self.set_timeout(None)
+
+        if res.isError():
+            return None
+        self.bus.answered(self.slave)
+
+        dc_voltage = max(res.registers[0], res.registers[2]) * 0.1
+        logger.debug("Wake probe: DC voltage %.1f V" % dc_voltage)
+        return (dc_voltage >= utils.INVERTER_SLEEP_DC_VOLTAGE)
@@ -22,11 +22,39 @@ config.read([config_file_path])
 
 PUBLISH_CONFIG_VALUES = int(config["DEFAULT"]["PUBLISH_CONFIG_VALUES"])
 
+# Keys added after the first release fall back to the shipped defaults, a config.ini kept from an older install lacks them
+
 INVERTER_TYPE = config['INVERTER']['TYPE']
+INVERTER_ADDRESSES = [int(address) for address in config.get('INVERTER', 'ADDRESS', fallback="1").split(",")] # slave ids on the bus, e.g. 1,2,3,4
 INVERTER_MAX_AC_POWER = float(config['INVERTER']['MAX_AC_POWER'])
 INVERTER_PHASE = config['INVERTER']['PHASE'] # L1; L2; L3
 INVERTER_POLL_INTERVAL = int(config['INVERTER']['POLL_INTERVAL'])
+INVERTER_POLL_INTERVAL_SLOW = config.getint('INVERTER', 'POLL_INTERVAL_SLOW', fallback=5000) # energy totals, power limit readback
+INVERTER_POLL_INTERVAL_STATIC = config.getint('INVERTER', 'POLL_INTERVAL_STATIC', fallback=60000) # output type
 INVERTER_POSITION = int(config['INVERTER']['POSITION']) # 0 = AC input 1; 1 = AC output; 2 = AC input 2
+INVERTER_REGISTER_GAP = config.getint('INVERTER', 'REGISTER_GAP', fallback=20) # max. unused registers bridged to merge two reads
+INVERTER_RECONNECT_INTERVAL_MAX = config.getint('INVERTER', 'RECONNECT_INTERVAL_MAX', fallback=60000) # max. wake probe interval while the inverter sleeps
+INVERTER_SLEEP_DC_VOLTAGE = config.getfloat('INVERTER', 'SLEEP_DC_VOLTAGE', fallback=50) # below this DC voltage without AC power the inverter is dark
+INVERTER_SLEEP_AFTER = config.getint('INVERTER', 'SLEEP_AFTER', fallback=300) # seconds of darkness before sleeping
+
+# Changes up to the deadband are not published: absolute value or percentage of the last published value
+DEADBAND_VOLTAGE = config.get('DEADBAND', 'VOLTAGE', fallback="1")
+DEADBAND_CURRENT = config.get('DEADBAND', 'CURRENT', fallback="0.1")
+DEADBAND_POWER = config.get('DEADBAND', 'POWER', fallback="1")
+DEADBAND_ENERGY = config.get('DEADBAND', 'ENERGY', fallback="0")
+
+# Resolutions of the in-memory history, step in seconds: rows, e.g. 1:600 for 10 minutes at 1 s
+HISTORY_RESOLUTIONS = config.get('HISTORY', 'RESOLUTIONS', fallback="1:600,60:1440,900:2880")
+HISTORY_SOCKET_DIR = config.get('HISTORY', 'SOCKET_DIR', fallback="/run") # the history is queried on a unix socket in this directory, empty to disable
+ENERGY_STATE_DIRECTORY = config.get('ENERGY', 'STATE_DIRECTORY', fallback="/data/serialinverter") # per-phase energy counters are kept in this directory
+ENERGY_PERSIST_INTERVAL = config.getint('ENERGY', 'PERSIST_INTERVAL', fallback=900)
+ENERGY_MAX_GAP = config.getfloat('ENERGY', 'MAX_GAP', fallback=60)
+RECORDER_DIRECTORY = config.get('RECORDER', 'DIRECTORY', fallback="") # every poll is recorded to a file in this directory, empty to disable
+RECORDER_FLUSH_INTERVAL = config.getint('RECORDER', 'FLUSH_INTERVAL', fallback=300)
+RECORDER_MAX_SIZE = config.getint('RECORDER', 'MAX_SIZE', fallback=10485760)
+RECORDER_FILES = config.getint('RECORDER', 'FILES', fallback=3)
+
+DEBUG_SUMMARY_INTERVAL = config.getint('DEBUG', 'SUMMARY_INTERVAL', fallback=60) # seconds between timing summaries in the log and on /Debug
 
 locals_copy = locals().copy()
 